@@ -35,6 +35,7 @@ setup(
         "console_scripts": [
             "wikiextractor = wikiextractor.WikiExtractor:main",
             "extractPage = wikiextractor.extractPage:main",
+            "pageIndex = wikiextractor.page_index:main",
             ]
         },
     python_requires='>=3.6',
@@ -0,0 +1,67 @@
+import bz2
+import mmap
+import random
+
+import pytest
+
+from wikiextractor.decompress import bz2_blocks, parallel_bz2_blocks, parallel_bz2_chunks
+
+# ----------------------------------------------------------------------
+# Round trip of the bit-level splitting of bz2 files into blocks
+
+def false_magic_data():
+	"""
+	:return: data whose bz2 compression, at level 9, contains a block magic
+	number within its single block, at bit 102.
+	The header of the block, after the magic number, holds the CRC of the data
+	(ending in the first 10 bits of the magic), the origPtr of the BWT (the
+	count of bytes below the first one) and the map of the byte ranges used.
+	"""
+	return b'\x61' + b'\x01\x30\x41' * 235622 + b'\x81\x91\xc1' * 33333 + b'\xcc\xce\xc4'
+
+@pytest.fixture(scope='module')
+def streams():
+	""":return: dict from name to compressed data."""
+	rng = random.Random(1)
+	words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(1, 10))) for _ in range(5000)]
+	text = ' '.join(rng.choices(words, k=400000)).encode()
+	streams = {
+		'level1': bz2.compress(text, 1),
+		'level9': bz2.compress(text, 9),
+		'false_magic': bz2.compress(false_magic_data(), 9),
+	}
+	streams['concatenated'] = b''.join(streams.values())
+	return streams
+
+@pytest.fixture(params=['level1', 'level9', 'false_magic', 'concatenated'])
+def dump(request, streams, tmp_path):
+	""":return: pair (file name, decompressed data)."""
+	filename = tmp_path / (request.param + '.bz2')
+	filename.write_bytes(streams[request.param])
+	return str(filename), bz2.decompress(streams[request.param])
+
+def magic_numbers(filename):
+	with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+		return sum(1 for _ in bz2_blocks(buf))
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_chunks(dump, threads):
+	filename, data = dump
+	assert b''.join(parallel_bz2_chunks(filename, threads)) == data
+
+def test_blocks_from_position(dump):
+	filename, data = dump
+	blocks = list(parallel_bz2_blocks(filename, 3))
+	offset = 0
+	for start, block in blocks:
+		if start in (blocks[len(blocks) // 2][0], blocks[-1][0]):
+			rest = b''.join(block for _, block in parallel_bz2_blocks(filename, 1, start))
+			assert rest == data[offset:]
+		offset += len(block)
+
+def test_false_magic(streams, tmp_path):
+	filename = tmp_path / 'false_magic.bz2'
+	filename.write_bytes(streams['false_magic'])
+	# two magic numbers, joined into one block
+	assert magic_numbers(str(filename)) == 2
+	assert len(list(parallel_bz2_blocks(str(filename), 2))) == 1
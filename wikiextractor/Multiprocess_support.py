@@ -2,19 +2,158 @@
 
 from io import StringIO
 import logging
+import os
+import pickle
+import queue
+import tempfile
 from timeit import default_timer
 
+from wikiextractor import constents, utilities
 from wikiextractor.NextFile import NextFile
 from wikiextractor.OutputSplitter import OutputSplitter
+from wikiextractor.extract import extract
+from wikiextractor.extract.DiscardPruner import DiscardPruner
+from wikiextractor.extract.Template import template_cache, templateCacheBudget
+from wikiextractor.extract.TemplateCalibration import TemplateCalibration
+from wikiextractor.extract.TemplateProfile import TemplateProfile
 from wikiextractor.extract.extract import Extractor
+from wikiextractor.manifest import PreviousRun, manifest_path, read_manifest
+from wikiextractor.template_store import TemplateStore
+from wikiextractor.utilities import LRUCache
 
 
-def extract_process(jobs_queue, output_queue, html_safe):
+# Settings in constents and in Extractor, filled in by the parent from
+# <siteinfo> and the command line, which spawned workers do not inherit.
+sharedSettings = ('urlbase', 'dbname', 'acceptedNamespaces', 'knownNamespaces',
+				  'templateNamespace', 'moduleNamespace', 'modulePrefix',
+				  'pageFilter', 'previousRun')
+extractorSettings = ('keepLinks', 'keepSections', 'HtmlFormatting', 'to_json',
+					 'templatePrefix', 'policy')
+
+def config_snapshot(template_store=None, profile=False):
+	"""
+	:param template_store: optional name of the TemplateStore with the
+	templates, which workers map in memory rather than receiving a copy.
+	:param profile: whether workers record a TemplateProfile.
+	:return: the settings collected by the parent, which spawned workers do
+	not inherit.
+	"""
+	return {
+		'constents': {name: getattr(constents, name) for name in sharedSettings},
+		'Extractor': {name: getattr(Extractor, name) for name in extractorSettings},
+		'ignoredTags': extract.ignored_tag_patterns,
+		'templateStore': template_store,
+		# the size only: the expansions of the parent are not sent
+		'expansionCache': Extractor.expansionCache.maxsize,
+		'templateCache': getattr(constents.templateCache, 'maxsize', templateCacheBudget),
+		'profile': profile,
+		'prune': Extractor.pruner is not None,
+		'calibration': Extractor.calibration.sample if Extractor.calibration else 0,
+	}
+
+def apply_config(config):
+	"""Install in this process the settings from :param config:."""
+	for name, value in config['constents'].items():
+		setattr(constents, name, value)
+	for name, value in config['Extractor'].items():
+		setattr(Extractor, name, value)
+	extract.ignored_tag_patterns = config['ignoredTags']
+	Extractor.expansionCache = LRUCache(config['expansionCache'])
+	constents.templateCache = template_cache(config['templateCache'])
+	Extractor.profile = TemplateProfile() if config['profile'] else None
+	Extractor.pruner = DiscardPruner() if config['prune'] else None
+	Extractor.calibration = TemplateCalibration(config['calibration']) if config['calibration'] else None
+	if config['templateStore']:
+		# kept open for the life of the process
+		TemplateStore(config['templateStore']).install()
+
+def worker_stats():
+	"""
+	:return: the counters of the caches of this process, its profile
+	records if profiling, those of pruning and of calibration if enabled, sent to the parent at the end.
+	"""
+	return {
+		'caches': {
+			'Parsed template cache': constents.templateCache.stats(),
+			'Template expansion cache': Extractor.expansionCache.stats(),
+			'Template title cache': Extractor.titles.templates.stats(),
+			'Link title cache': Extractor.titles.links.stats(),
+			'Expression cache': utilities.exprCache.stats(),
+		},
+		'profile': Extractor.profile.records if Extractor.profile else None,
+		'pruning': Extractor.pruner.stats() if Extractor.pruner else None,
+		'calibration': (Extractor.calibration.pages, Extractor.calibration.records)
+			if Extractor.calibration else None,
+	}
+
+def collect_stats(workers, stats_queue):
+	"""
+	Wait for the :param workers: to terminate.
+	:return: the worker_stats() they put in :param stats_queue:, which are
+	read before joining them, since a worker cannot exit until what it put
+	is read. Workers that died without putting theirs are skipped.
+	"""
+	stats = []
+	while len(stats) < len(workers):
+		alive = any(w.is_alive() for w in workers)
+		try:
+			stats.append(stats_queue.get(timeout=1))
+		except queue.Empty:
+			if not alive:
+				break  # the others died
+	for w in workers:
+		w.join()
+	return stats
+
+def report_stats(stats, profile_file=None, calibration_file=None):
+	"""
+	Log the sum of the counters from worker_stats() of all workers.
+	:param profile_file: where to write the merged template profile.
+	:param calibration_file: where to write the skip list learned by the
+	merged template calibration.
+	"""
+	total = {}
+	pruned = {}
+	profile = TemplateProfile()
+	calibration = TemplateCalibration()
+	for worker in stats:
+		if worker['profile']:
+			profile.merge(worker['profile'])
+		if worker['calibration']:
+			calibration.merge(*worker['calibration'])
+		for counter, value in (worker['pruning'] or {}).items():
+			pruned[counter] = pruned.get(counter, 0) + value
+		for name, counters in worker['caches'].items():
+			for counter, value in counters.items():
+				total.setdefault(name, {}).setdefault(counter, 0)
+				total[name][counter] += value
+	for name, cache in total.items():
+		lookups = cache['hits'] + cache['misses']
+		if lookups:
+			logging.info("%s: %d hits, %d misses (%.1f%% hit rate), %d evictions",
+						 name, cache['hits'], cache['misses'], 100.0 * cache['hits'] / lookups,
+						 cache['evictions'])
+	if pruned:
+		logging.info("Pruned %d discarded elements before expansion, avoiding %d template expansions",
+					 pruned['elements'], pruned['templates'])
+	if profile_file:
+		profile.write(profile_file)
+		logging.info("Saved the profile of %d templates to '%s'", len(profile.records), profile_file)
+	if calibration_file:
+		calibration.write(calibration_file)
+		logging.info("Calibrated on %d pages: %d of %d templates contributed no text, saved to '%s'",
+					 calibration.pages, len(calibration.skipped()), len(calibration.records), calibration_file)
+
+
+def extract_process(jobs_queue, output_queue, html_safe, config, stats_queue):
 	"""Pull tuples of raw page content, do CPU/regex-heavy fixup, push finished text
 	:param jobs_queue: where to get jobs.
 	:param output_queue: where to queue extracted text for output.
 	:html_safe: whether to convert entities in text to HTML.
+	:param config: settings from config_snapshot() in the parent.
+	:param stats_queue: where to put worker_stats() at the end.
 	"""
+	apply_config(config)
 	while True:
 		job = jobs_queue.get()  # job is (id, revid, urlbase, title, page)
 		if not  job:
@@ -22,37 +161,152 @@ def extract_process(jobs_queue, output_queue, html_safe):
 		out = StringIO()  # memory buffer
 		Extractor(*job[:-1]).extract(out, html_safe)  # (id, urlbase, title, page)
 		text = out.getvalue()
-		output_queue.put((job[-1], text))  # (ordinal, extracted_text)
+		output_queue.put((job[-1], text, job[0], job[1]))  # (ordinal, extracted_text, id, revid)
 		out.close()
+	stats_queue.put(worker_stats())
 
-def reduce_process(output_queue, out_file, file_size, file_compress):
+def extract_chunk_process(jobs_queue, output_queue, html_safe, config, stats_queue):
+	"""Pull chunks of the dump, collect their pages and extract them.
+	The pages of chunk c get ordinals (c, 0), (c, 1), ..., and the end of the
+	chunk is signalled by a None text for the ordinal after its last page.
+	Pages unchanged since the previous run are not extracted, and are queued
+	with a None text.
+	:param jobs_queue: where to get jobs.
+	:param output_queue: where to queue extracted text for output.
+	:html_safe: whether to convert entities in text to HTML.
+	:param config: settings from config_snapshot() in the parent.
+	:param stats_queue: where to put worker_stats() at the end.
+	"""
+	apply_config(config)
+	previous = PreviousRun(*constents.previousRun) if constents.previousRun else None
+	while True:
+		job = jobs_queue.get()  # job is (chunk, reader, args)
+		if not job:
+			break
+		chunk, reader, args = job
+		ordinal = 0
+		for id, revid, title, page in reader(*args):
+			if previous and previous.unchanged(id, revid):
+				output_queue.put(((chunk, ordinal), None, id, revid))  # carry over
+			else:
+				out = StringIO()  # memory buffer
+				Extractor(id, revid, constents.urlbase, title, page).extract(out, html_safe)
+				output_queue.put(((chunk, ordinal), out.getvalue(), id, revid))
+				out.close()
+			ordinal += 1
+		output_queue.put(((chunk, ordinal), None, None, None))  # end of chunk
+	if previous:
+		previous.close()
+	stats_queue.put(worker_stats())
+
+# Beyond this many bytes of buffered text, the text of chunks following the
+# current one is spilled to temporary files.
+spillSize = 64 * 1024 * 1024
+
+def reduce_process(output_queue, out_file, file_size, file_compress, articles=None,
+				   manifest=False, previous=None, changes=False):
 	"""
 	Pull finished article text, write series of files (or stdout)
 	:param output_queue: text to be output.
 	:param output: file object where to print.
+	:param articles: optional shared Value where to store the number of
+	articles written.
+	:param manifest: whether to write a manifest of the documents in out_file.
+	:param previous: optional pair (directory, lookup file) of a previous run,
+	from which to copy the documents queued with a None text.
+	:param changes: whether the input has only the pages changed since the
+	previous run, so that the documents of the other ones are to be copied.
+	Queued entries are tuples (ordinal, text, id, revid), where ordinals are
+	either page numbers or pairs (chunk, page number within chunk), as produced
+	by extract_chunk_process.
+	Since the pages of a chunk arrive in order, from a single worker, chunks
+	ahead of the current one can be spilled to disk and replayed sequentially:
+	a large chunk, like a part of a split dump, does not have to be kept in
+	memory while waiting for the previous ones.
 	"""
 	nextFile = NextFile(out_file)
 	output = OutputSplitter(nextFile, file_size, file_compress)
+	manifest_file = open(manifest_path(out_file), 'w', encoding='utf-8') if manifest else None
+	previous = PreviousRun(*previous) if previous else None
+	seen = set()  # ids of the pages in the input, for changes
 	interval_start = default_timer()
 	period = 100000
 	# FIXME: use a heap
-	ordering_buffer = {}  # collected pages
-	next_ordinal = 0  # sequence number of pages
+	ordering_buffer = {}  # collected entries (text, id, revid)
+	buffered = 0  # size of the text in ordering_buffer
+	spills = {}  # chunk -> temporary file with its later pages
+	next_chunk = 0
+	next_ordinal = 0  # sequence number of pages within chunk
+	written = 0
+
+	def write(text, id, revid):
+		offset = output.write(text)
+		if manifest_file:
+			manifest_file.write('%s\t%s\t%s\t%d\t%d\n' % (
+				id, revid, os.path.relpath(output.filename, out_file), offset,
+				len(text.encode('utf-8'))))
+
 	while True:
-		if next_ordinal in ordering_buffer:
-			output.write(ordering_buffer.pop(next_ordinal))
-			next_ordinal += 1
-			# progress report
-			if next_ordinal % period == 0:
-				interval_rate = period / (default_timer() - interval_start)
-				logging.info("Extracted %d articles (%.1f art/s)",
-							 next_ordinal, interval_rate)
-				interval_start = default_timer()
+		if (next_chunk, next_ordinal) in ordering_buffer:
+			text, id, revid = ordering_buffer.pop((next_chunk, next_ordinal))
+			if text:
+				buffered -= len(text)
+		elif next_chunk in spills:
+			# the pages of the chunk in memory precede those spilled
+			try:
+				_, text, id, revid = pickle.load(spills[next_chunk])
+			except EOFError:
+				spills.pop(next_chunk).close()
+				continue
 		else:
 			# mapper puts None to signal finish
-			pair = output_queue.get()
-			if not pair:
+			entry = output_queue.get()
+			if not entry:
 				break
-			ordinal, text = pair
-			ordering_buffer[ordinal] = text
-
+			ordinal, text, id, revid = entry
+			if isinstance(ordinal, int):
+				ordinal = (0, ordinal)
+			chunk = ordinal[0]
+			if chunk > next_chunk and (chunk in spills or buffered > spillSize):
+				if chunk not in spills:
+					spills[chunk] = tempfile.TemporaryFile()
+				pickle.dump(entry, spills[chunk])
+			else:
+				ordering_buffer[ordinal] = (text, id, revid)
+				if text:
+					buffered += len(text)
+			continue
+		if text is None and id is None:  # end of chunk
+			if next_chunk in spills:
+				spills.pop(next_chunk).close()
+			next_chunk += 1
+			next_ordinal = 0
+			if next_chunk in spills:
+				spills[next_chunk].seek(0)
+			continue
+		if text is None:  # unchanged since the previous run
+			text = previous.document(id)
+		write(text, id, revid)
+		if changes:
+			seen.add(int(id))
+		next_ordinal += 1
+		written += 1
+		# progress report
+		if written % period == 0:
+			interval_rate = period / (default_timer() - interval_start)
+			logging.info("Extracted %d articles (%.1f art/s)",
+						 written, interval_rate)
+			interval_start = default_timer()
+	if changes:
+		# the pages not in the input are unchanged
+		for id, revid, shard, offset, length in read_manifest(previous.dir):
+			if id not in seen:
+				write(previous.read(shard, offset, length), id, revid)
+				written += 1
+	output.close()
+	if manifest_file:
+		manifest_file.close()
+	if previous:
+		previous.close()
+	if articles is not None:
+		articles.value = written
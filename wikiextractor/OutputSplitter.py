@@ -24,17 +24,25 @@ class OutputSplitter:
 			self.file = self.open(self.nextFile.next())
 
 	def write(self, data):
+		"""
+		:return: the offset in bytes where :param data: was written within
+		the current file, self.filename.
+		"""
 		self.reserve(len(data))
+		offset = self.file.tell()
 		if self.compress:
 			self.file.write(data.encode('utf-8'))
 		else:
 			self.file.write(data)
+		return offset
 
 	def close(self):
 		self.file.close()
 
 	def open(self, filename):
 		if self.compress:
-			return bz2.BZ2File(filename + '.bz2', 'w')
+			self.filename = filename + '.bz2'
+			return bz2.BZ2File(self.filename, 'w')
 		else:
+			self.filename = filename
 			return open(filename, 'w',encoding='utf-8')
@@ -1,18 +1,43 @@
 from wikiextractor import constents
 
+def keep_page(title, id, last_id, redirect):
+	"""Whether a page read from the dump is to be extracted."""
+	colon = title.find(':')
+	return (colon < 0 or (title[:colon] in constents.acceptedNamespaces) and id != last_id and
+			not redirect and not title.startswith(constents.templateNamespace))
+
 def  collect_pages(text):
-	"""param text: the text of a wikipedia file dump."""
+	"""param text: the text of a wikipedia file dump.
+	Pages with several revisions, as in history dumps, yield the text of the
+	newest revision, or of the newest one accepted by the timestamp window of
+	constents.pageFilter. The text of the other revisions is discarded while
+	streaming, hence only one revision at a time is kept in memory.
+	"""
 	# we collect individual lines, since str.join() is significantly faster
 	# than concatenation
 	page = []
 	id = ''
 	revid = ''
+	ns = None
 	last_id = ''
 	inText = False
 	redirect = False
+	skip = False  # page rejected from its header: ignore the rest
+	inHeader = True  # before the first <revision>
+	rev_id = ''  # id of the current revision
+	timestamp = None  # of the current revision
+	collecting = False  # whether the text of the current revision is wanted
+	found = False  # whether a revision has been chosen
+	pageFilter = constents.pageFilter
+	timeFilter = pageFilter and pageFilter.has_timestamp()
 	for line in text:
+		if skip:
+			if '</page>' not in line:
+				continue
+			skip = False
+			inText = False  # process the end of page
 		if '<' not in line:     # faster than doing re.search()
-			if inText:
+			if collecting:
 				page.append(line)
 			continue
 		m = constents.tagRE.search(line)
@@ -22,34 +47,63 @@ def  collect_pages(text):
 		if tag == 'page':
 			page = []
 			redirect = False
-		elif tag == 'id' and not id:
+		elif inText and tag != '/text':
+			if collecting:
+				page.append(line)
+		elif tag == 'id' and inHeader:
 			id = m.group(3)
-		elif tag == 'id' and id: # <revision> <id></id> </revision>
-			revid = m.group(3)
+		elif tag == 'id' and not rev_id: # <revision> <id></id> </revision>
+			rev_id = m.group(3)
 		elif tag == 'title':
 			title = m.group(3)
+		elif tag == 'ns':
+			ns = int(m.group(3))
 		elif tag == 'redirect':
 			redirect = True
+		elif tag == 'revision':
+			if inHeader:
+				# the header is complete
+				inHeader = False
+				skip = not keep_page(title, id, last_id, redirect) or (
+					pageFilter and not pageFilter.accept(title, ns, id))
+			rev_id = ''
+			timestamp = None
+		elif tag == 'timestamp':
+			timestamp = m.group(3)
 		elif tag == 'text':
-			inText = True
-			line = line[m.start(3):m.end(3)]
-			page.append(line)
-			if m.lastindex == 4:  # open-close
-				inText = False
+			# choose this revision, replacing the previous one
+			wanted = not timeFilter or (timestamp is not None and
+										pageFilter.accept_timestamp(timestamp))
+			if wanted:
+				page = []
+				revid = rev_id
+				found = True
+			elif found and timestamp and pageFilter.after(timestamp):
+				# revisions are in chronological order: none of the next ones is wanted
+				skip = True
+				continue
+			if line[m.start(3) - 2] == '/':  # empty <text/>
+				continue
+			if wanted:
+				page.append(line[m.start(3):m.end(3)])
+			if m.lastindex != 4:  # not open-close
+				inText = True
+				collecting = wanted
 		elif tag == '/text':
-			if m.group(1):
+			if m.group(1) and collecting:
 				page.append(m.group(1))
 			inText = False
-		elif inText:
-			page.append(line)
+			collecting = False
 		elif tag == '/page':
-			colon = title.find(':')
-			if (colon < 0 or (title[:colon] in constents.acceptedNamespaces) and id != last_id and
-					not redirect and not title.startswith(constents.templateNamespace)):
+			if found and keep_page(title, id, last_id, redirect):
 				yield (id, revid, title, page)
 				last_id = id
 			id = ''
 			revid = ''
+			ns = None
 			page = []
 			inText = False
 			redirect = False
+			inHeader = True
+			collecting = False
+			found = False
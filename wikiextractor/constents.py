@@ -4,6 +4,7 @@ import re
 
 
 urlbase = ''                # This is obtained from <siteinfo>
+dbname = ''                 # Likewise, e.g. enwiki
 ##
 # Recognize only these namespaces
 # w: Internal links to the Wikipedia
@@ -53,7 +54,14 @@ reIncludeonly = re.compile(r'<includeonly>|</includeonly>', re.DOTALL)
 # These are built before spawning processes, hence they are shared.
 templates = {}
 redirects = {}
-# cache of parser templates
+# expansions of the templates that expand the same in every page
+constantTemplates = {}
+# the templates that each of them includes, one title per line, since they
+# expand otherwise when a TemplatePolicy skips any of those
+constantIncludes = {}
+# cache of parsed templates, in each process: replaced by an LRUCache bounded
+# by their memory, from which they are reparsed when evicted, in the workers
+# by apply_config()
 # FIXME: sharing this with a Manager slows down.
 templateCache = {}
 
@@ -90,5 +98,12 @@ modulePrefix = moduleNamespace + ':'
 # The buggy template {{Template:T}} has a comment terminating with just "->"
 comment = re.compile(r'<!--.*?-->', re.DOTALL)
 
+# Optional page_filter.PageFilter, applied by the readers of the dump
+pageFilter = None
+
+# Optional pair (output directory, lookup file) of a previous run, whose
+# documents of unchanged pages are copied rather than extracted again
+previousRun = None
+
 # Minimum size of output files
 minFileSize = 200 * 1024
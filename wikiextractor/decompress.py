@@ -0,0 +1,274 @@
+import bz2
+import io
+import mmap
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# ----------------------------------------------------------------------
+# Multi-threaded decompression
+#
+# The stdlib codecs release the GIL while decompressing, hence decompression
+# can proceed in other threads while the main thread collects pages.
+
+chunkSize = 1024 * 1024
+
+class ChunkReader(io.RawIOBase):
+
+	"""
+	Raw binary stream over an iterator of bytes chunks.
+	"""
+
+	def __init__(self, chunks):
+		"""
+		:param chunks: an iterator (generator) over bytes, consumed in order.
+		"""
+		self.chunks = chunks
+		self.chunk = b''
+		self.pos = 0
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		while self.pos >= len(self.chunk):
+			self.chunk = next(self.chunks, None)
+			self.pos = 0
+			if self.chunk is None:
+				self.chunk = b''
+				return 0
+		n = min(len(b), len(self.chunk) - self.pos)
+		b[:n] = self.chunk[self.pos:self.pos + n]
+		self.pos += n
+		return n
+
+	def close(self):
+		if not self.closed:
+			self.chunks.close()
+		super().close()
+
+
+def background_chunks(read, size=8):
+	"""
+	Call :param read: in a separate thread until it returns b'', queueing up
+	to :param size: chunks ahead of the consumer.
+	:return: an iterator over the chunks.
+	"""
+	chunks = queue.Queue(maxsize=size)
+	stop = threading.Event()
+
+	def producer():
+		try:
+			while not stop.is_set():
+				chunk = read()
+				chunks.put(chunk)
+				if not chunk:
+					break
+		except Exception as e:
+			chunks.put(e)
+
+	thread = threading.Thread(target=producer, daemon=True)
+	thread.start()
+	try:
+		while True:
+			chunk = chunks.get()
+			if isinstance(chunk, Exception):
+				raise chunk
+			if not chunk:
+				break
+			yield chunk
+	finally:
+		stop.set()
+		# unblock the producer
+		while thread.is_alive():
+			try:
+				chunks.get(timeout=0.1)
+			except queue.Empty:
+				pass
+
+def stream_chunks(stream, threaded=False):
+	"""
+	Read the binary file object :param stream: in chunks, closing it at the end.
+	:param threaded: whether to read, and decompress, in a background thread.
+	Streams like gzip cannot be split, but this overlaps decompression with
+	parsing.
+	"""
+	with stream:
+		if threaded:
+			yield from background_chunks(lambda: stream.read(chunkSize))
+		else:
+			yield from iter(lambda: stream.read(chunkSize), b'')
+
+# ----------------------------------------------------------------------
+# bzip2 blocks
+#
+# A bz2 stream is the header 'BZh' + level, followed by blocks, each starting
+# with a 48 bit magic number and its 32 bit CRC, and by an end of stream
+# marker and the combined CRC. Blocks are not byte aligned, but each can be
+# turned into a stream on its own by shifting its bits after a header and
+# appending an end of stream marker with the block CRC.
+
+blockMagic = 0x314159265359
+eosMagic = 0x177245385090
+
+def magic_patterns(magic):
+	"""
+	:return: for each bit offset s within a byte, the triple
+	(s, middle, (first, first_mask, last, last_mask)) where middle are the
+	bytes fully covered by :param magic: when starting at bit s, and first and
+	last are the partially covered bytes.
+	"""
+	patterns = []
+	for s in range(8):
+		nbytes = 6 if s == 0 else 7
+		value = magic << (nbytes * 8 - 48 - s)
+		b = value.to_bytes(nbytes, 'big')
+		if s == 0:
+			patterns.append((s, b, None))
+		else:
+			first_mask = 0xff >> s
+			last_mask = (0xff << (8 - ((s + 48) % 8 or 8))) & 0xff
+			patterns.append((s, b[1:6], (b[0], first_mask, b[6], last_mask)))
+	return patterns
+
+blockPatterns = magic_patterns(blockMagic)
+eosPatterns = magic_patterns(eosMagic)
+
+def find_magic(buf, patterns, start, end):
+	"""
+	:return: the sorted bit positions where the magic number described by
+	:param patterns: starts, within bytes [start, end) of :param buf:.
+	"""
+	positions = []
+	for s, middle, edges in patterns:
+		cur = start + (1 if edges else 0)
+		while True:
+			i = buf.find(middle, cur, end)
+			if i < 0:
+				break
+			cur = i + 1
+			if edges:
+				first, first_mask, last, last_mask = edges
+				if i + 5 >= len(buf):
+					continue
+				if (buf[i - 1] & first_mask != first or
+						buf[i + 5] & last_mask != last):
+					continue
+				positions.append((i - 1) * 8 + s)
+			else:
+				positions.append(i * 8)
+	positions.sort()
+	return positions
+
+def bz2_blocks(buf, offset=0, window=8 * chunkSize):
+	"""
+	Locate the blocks in the bz2 data :param buf:, from byte :param offset:.
+	:return: an iterator over pairs (start, end) of bit positions delimiting
+	each block, magic number included.
+	"""
+	size = len(buf)
+	start = None
+	cur = offset
+	while cur < size:
+		# overlap windows so that a magic number across them is not missed
+		end = min(cur + window + 8, size)
+		boundaries = [(p, False) for p in find_magic(buf, blockPatterns, cur, end)]
+		boundaries += [(p, True) for p in find_magic(buf, eosPatterns, cur, end)]
+		boundaries.sort()
+		for p, eos in boundaries:
+			if p < cur * 8 or p >= (cur + window) * 8:
+				continue
+			if start is not None:
+				yield start, p
+			start = None if eos else p
+		cur += window
+
+def bz2_block_stream(buf, start, end):
+	"""
+	:return: a bz2 stream containing the block between bit positions
+	:param start: and :param end: of :param buf:.
+	"""
+	first = start // 8
+	last = (end + 7) // 8
+	bits = int.from_bytes(buf[first:last], 'big')
+	nbits = end - start
+	bits >>= (last - first) * 8 - (start % 8) - nbits
+	bits &= (1 << nbits) - 1
+	crc = (bits >> (nbits - 80)) & 0xffffffff
+	bits = (((bits << 48) | eosMagic) << 32) | crc
+	nbits += 80
+	pad = -nbits % 8
+	return b'BZh9' + (bits << pad).to_bytes((nbits + pad) // 8, 'big')
+
+def bz2_decompress_block(buf, start, end):
+	return bz2.decompress(bz2_block_stream(buf, start, end))
+
+def parallel_bz2_chunks(filename, threads):
+	"""
+	Decompress the blocks of the bz2 file :param filename: with a pool of
+	:param threads: threads.
+	:return: an iterator over the decompressed blocks, in order.
+	"""
+	blocks = parallel_bz2_blocks(filename, threads)
+	try:
+		for _, data in blocks:
+			yield data
+	finally:
+		blocks.close()
+
+def parallel_bz2_blocks(filename, threads, position=0):
+	"""
+	Same as parallel_bz2_chunks(), but yield pairs (start, data) where start
+	is the bit position of the block in the file.
+	:param position: bit position of the first block to decompress.
+	"""
+	with open(filename, 'rb') as file:
+		if not os.path.getsize(filename):
+			return
+		with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf, \
+				ThreadPoolExecutor(max_workers=threads) as executor:
+			pending = deque()  # (start, end, future)
+			blocks = (block for block in bz2_blocks(buf, position // 8) if block[0] >= position)
+			exhausted = False
+			while True:
+				while not exhausted and len(pending) < 2 * threads:
+					block = next(blocks, None)
+					if block is None:
+						exhausted = True
+						break
+					pending.append((*block, executor.submit(bz2_decompress_block, buf, *block)))
+				if not pending:
+					break
+				start, end, future = pending.popleft()
+				try:
+					yield start, future.result()
+				except (OSError, ValueError, EOFError):
+					# the magic number occurred by chance within a block:
+					# join it with the following ones until it decompresses
+					while True:
+						if pending:
+							_, end, future = pending.popleft()
+							future.cancel()
+						else:
+							block = next(blocks, None)
+							if block is None:
+								raise
+							end = block[1]
+						try:
+							data = bz2_decompress_block(buf, start, end)
+							break
+						except (OSError, ValueError, EOFError):
+							continue
+					yield start, data
+
+def open_chunks(chunks, mode='rt', encoding='utf-8'):
+	"""
+	:return: a file object for reading the data produced by :param chunks:,
+	text or binary according to :param mode:.
+	"""
+	file = io.BufferedReader(ChunkReader(chunks), chunkSize)
+	if 't' in mode:
+		return io.TextIOWrapper(file, encoding=encoding)
+	return file
@@ -0,0 +1,87 @@
+import glob
+import logging
+import os
+import re
+
+from wikiextractor.collect_pages import collect_pages
+from wikiextractor.load_templates import template_pages
+from wikiextractor.page_splitter import mmap_pages, mmap_template_pages
+from wikiextractor.utilities import codecs, decode_open, file_codec
+
+# ----------------------------------------------------------------------
+# Split dumps
+#
+# Large wikis are published also as parts, e.g.
+# enwiki-latest-pages-articles1.xml-p1p41242.bz2, ..., each with its own
+# <siteinfo> header. The parts are processed as one logical dump: each part
+# is a chunk for extract_chunk_process, hence parts are read and decompressed
+# concurrently by the workers, while the output keeps the order of the parts.
+
+# names of dump files: .xml, then possibly the page range of a part and the
+# suffix of a codec, e.g. .xml-p1p41242.bz2
+dumpName = re.compile(r'\.xml(?:-p\d+(?:p\d+)?)?(?:\.(?:%s))?$' % '|'.join(codecs))
+
+def natural_key(name):
+	"""Sort key placing part 2 before part 10."""
+	return [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', name)]
+
+def dump_parts(inputs):
+	"""
+	Expand the inputs of the extractor into the list of dump files.
+	:param inputs: list of file names, directories or glob patterns. The files
+	in a directory, or matching a pattern, are taken in natural order, if
+	named like dump files, except for multistream indexes: checksums, status
+	files and partial downloads are skipped.
+	:return: the list of files, in order.
+	"""
+	parts = []
+	for name in inputs:
+		if name == '-' or os.path.isfile(name):
+			parts.append(name)
+			continue
+		if os.path.isdir(name):
+			files = [os.path.join(name, f) for f in os.listdir(name)]
+		else:
+			files = glob.glob(name)
+		files = [f for f in files if os.path.isfile(f) and '-index' not in os.path.basename(f)]
+		skipped = [f for f in files if not dumpName.search(os.path.basename(f))]
+		if skipped:
+			logging.info('Skipping %d files not named like dump files in %s: %s', len(skipped), name,
+						 ', '.join(sorted(os.path.basename(f) for f in skipped)))
+			files = [f for f in files if f not in skipped]
+		if not files:
+			raise ValueError('No dump files in: %s' % name)
+		parts.extend(sorted(files, key=natural_key))
+	return parts
+
+def part_pages(input_file):
+	"""
+	Collect the pages to be extracted from a part of the dump.
+	:return: an iterator over tuples (id, revid, title, page).
+	"""
+	if not file_codec(input_file):
+		yield from mmap_pages(input_file)
+		return
+	with decode_open(input_file) as input:
+		yield from collect_pages(input)
+
+def parts_template_pages(parts, discover_namespace=False, threads=0):
+	"""
+	Collect the pages of all :param parts:, for define_templates().
+	:param threads: number of threads for decompressing each part.
+	:return: an iterator over pairs (title, page).
+	"""
+	for part in parts:
+		if not file_codec(part):
+			yield from mmap_template_pages(part)
+			continue
+		with decode_open(part, threads=threads) as input:
+			yield from template_pages(input, discover_namespace)
+
+def part_jobs(parts):
+	"""
+	Generate the jobs for extract_chunk_process, one for each part.
+	:return: an iterator over tuples (chunk, reader, args).
+	"""
+	for chunk, part in enumerate(parts):
+		yield (chunk, part_pages, (part,))
@@ -0,0 +1,277 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import math
+import re
+
+# ----------------------------------------------------------------------
+# Expressions of the #expr and #ifexpr parser functions
+# @see https://www.mediawiki.org/wiki/Help:Extension:ParserFunctions##expr
+#
+# Evaluated like Expr.php of ParserFunctions, by operator precedence parsing
+# with a stack of operands and one of operators, rather than by eval():
+# only numbers, the constants e and pi, and the operators below are accepted.
+# All binary operators are left associative, e.g. 2^3^2 = 64, and unary ones
+# bind tighter than ^, e.g. -2^2 = 4.
+# Numbers are floats, as in PHP; comparisons, logical operators, mod and
+# trunc give integers, which arithmetic keeps while they fit in 64 bits.
+
+class ExprError(Exception):
+	"""An invalid expression, or an operation without a result."""
+
+
+# operator -> (precedence, arity)
+operators = {
+	'negative': (10, 1), 'positive': (10, 1), 'e': (10, 2),
+	'sin': (9, 1), 'cos': (9, 1), 'tan': (9, 1), 'asin': (9, 1), 'acos': (9, 1),
+	'atan': (9, 1), 'exp': (9, 1), 'ln': (9, 1), 'abs': (9, 1), 'floor': (9, 1),
+	'trunc': (9, 1), 'ceil': (9, 1), 'not': (9, 1), 'sqrt': (9, 1),
+	'^': (8, 2),
+	'*': (7, 2), '/': (7, 2), 'div': (7, 2), 'mod': (7, 2), 'fmod': (7, 2),
+	'+': (6, 2), '-': (6, 2),
+	'round': (5, 2),
+	'=': (4, 2), '<': (4, 2), '>': (4, 2), '<=': (4, 2), '>=': (4, 2), '<>': (4, 2), '!=': (4, 2),
+	'and': (3, 2),
+	'or': (2, 2),
+	'(': (-1, 0),
+}
+
+# words valid where an operand is expected
+constants = {'e': math.e, 'pi': math.pi}
+functions = {'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'exp', 'ln', 'abs',
+			 'floor', 'trunc', 'ceil', 'not', 'sqrt'}
+# words valid where an operator is expected
+binaryWords = {'e', 'mod', 'fmod', 'and', 'or', 'round', 'div'}
+
+token = re.compile(r'[ \t\r\n]*(?:([0-9.]+)|([a-zA-Z]+)|(<=|>=|<>|!=|[-+*/^=<>()])|(.))', re.DOTALL)
+number = re.compile(r'\d*(?:\.\d*)?')
+
+# entities and signs taken as operators, as in Expr.php
+replacements = (('&lt;', '<'), ('&gt;', '>'), ('&minus;', '-'), ('−', '-'))
+
+def evaluate(expr):
+	"""
+	:param expr: the text of an expression.
+	:return: its value, an int or a float, or None if it is empty.
+	:raise ExprError: if the expression is invalid.
+	"""
+	for entity, char in replacements:
+		expr = expr.replace(entity, char)
+	operands = []
+	pending = []  # operators
+	expecting_operand = True
+	pos = 0
+	end = len(expr.rstrip(' \t\r\n'))
+	while pos < end:
+		m = token.match(expr, pos)
+		pos = m.end()
+		digits, word, op, other = m.groups()
+		if other:
+			raise ExprError('Unrecognized punctuation character "%s"' % other)
+		if expecting_operand:
+			if digits:
+				# the longest prefix of a number, as floatval() in PHP
+				digits = number.match(digits).group()
+				operands.append(float(digits) if digits.strip('.') else 0.0)
+				expecting_operand = False
+			elif word:
+				word = word.lower()
+				if word in constants:
+					operands.append(constants[word])
+					expecting_operand = False
+				elif word in functions:
+					pending.append(word)
+				elif word in binaryWords:
+					raise ExprError('Unexpected %s operator' % word)
+				else:
+					raise ExprError('Unrecognized word "%s"' % word)
+			elif op == '-':
+				pending.append('negative')
+			elif op == '+':
+				pending.append('positive')
+			elif op == '(':
+				pending.append('(')
+			elif op == ')':
+				raise ExprError('Unexpected closing bracket')
+			else:
+				raise ExprError('Unexpected %s operator' % op)
+			continue
+		# expecting an operator
+		if digits:
+			raise ExprError('Unexpected number')
+		if word:
+			word = word.lower()
+			if word in binaryWords:
+				op = word
+			elif word in functions or word in constants:
+				raise ExprError('Unexpected %s operator' % word)
+			else:
+				raise ExprError('Unrecognized word "%s"' % word)
+		if op == '(':
+			raise ExprError('Unexpected ( operator')
+		if op == ')':
+			while pending and pending[-1] != '(':
+				apply(pending.pop(), operands)
+			if not pending:
+				raise ExprError('Unexpected closing bracket')
+			pending.pop()
+			continue
+		precedence = operators[op][0]
+		while pending and precedence <= operators[pending[-1]][0]:
+			apply(pending.pop(), operands)
+		pending.append(op)
+		expecting_operand = True
+	if expecting_operand and (pending or operands):
+		raise ExprError('Missing operand for %s' % (pending[-1] if pending else 'expression'))
+	while pending:
+		op = pending.pop()
+		if op == '(':
+			raise ExprError('Unclosed bracket')
+		apply(op, operands)
+	return operands[0] if operands else None
+
+def integer(x):
+	"""Conversion to int, as (int) in PHP."""
+	return int(x) if math.isfinite(x) else 0
+
+def arithmetic(value):
+	"""Values of integer arithmetic beyond 64 bits become floats, as in PHP."""
+	if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+		return float(value)
+	return value
+
+def php_round(x, digits):
+	"""Round half away from zero, like round() in PHP."""
+	if not math.isfinite(x):
+		return x
+	try:
+		# the shortest representation of x, so that e.g. 2.675 rounds up
+		return float(Decimal(repr(float(x))).quantize(Decimal(1).scaleb(-digits), ROUND_HALF_UP))
+	except InvalidOperation:
+		# more digits than a float has
+		return float(x)
+
+def apply(op, operands):
+	"""Apply operator :param op: to the last of :param operands:."""
+	arity = operators[op][1]
+	if len(operands) < arity:
+		raise ExprError('Missing operand for %s' % op)
+	if arity == 1:
+		x = operands.pop()
+		if op == 'negative':
+			value = arithmetic(-x)
+		elif op == 'positive':
+			value = x
+		elif op == 'not':
+			value = int(not x)
+		elif op == 'trunc':
+			value = integer(x)
+		elif op == 'abs':
+			value = arithmetic(abs(x))
+		elif op in ('floor', 'ceil'):
+			value = float(getattr(math, op)(x)) if math.isfinite(x) else x
+		elif op == 'ln':
+			if x <= 0:
+				raise ExprError('Invalid argument for ln: <= 0')
+			value = math.log(x)
+		elif op in ('asin', 'acos'):
+			if not -1 <= x <= 1:
+				raise ExprError('Invalid argument for %s: < -1 or > 1' % op)
+			value = getattr(math, op)(x)
+		elif op == 'sqrt':
+			if x < 0:
+				raise ExprError('Result is not a number')
+			value = math.sqrt(x)
+		elif op == 'exp':
+			try:
+				value = math.exp(x)
+			except OverflowError:
+				value = math.inf
+		else:
+			# sin, cos, tan, atan
+			try:
+				value = getattr(math, op)(x)
+			except ValueError:
+				raise ExprError('Result is not a number')
+		operands.append(value)
+		return
+	right = operands.pop()
+	left = operands.pop()
+	ints = isinstance(left, int) and isinstance(right, int)
+	if op == '+':
+		value = arithmetic(left + right)
+	elif op == '-':
+		value = arithmetic(left - right)
+	elif op == '*':
+		value = arithmetic(left * right) if ints else float(left) * right
+	elif op in ('/', 'div'):
+		if right == 0:
+			raise ExprError('Division by zero')
+		value = left // right if ints and left % right == 0 else left / right
+	elif op == 'mod':
+		left, right = integer(left), integer(right)
+		if right == 0:
+			raise ExprError('Division by zero')
+		# the sign of the dividend, as in PHP
+		value = int(math.copysign(abs(left) % abs(right), left))
+	elif op == 'fmod':
+		if right == 0:
+			raise ExprError('Division by zero')
+		try:
+			value = math.fmod(left, right)
+		except ValueError:
+			raise ExprError('Result is not a number')
+	elif op == '^':
+		if ints and 0 <= right < 64:
+			value = arithmetic(left ** right)
+		elif left == 0 and right < 0:
+			value = math.inf
+		else:
+			try:
+				value = math.pow(left, right)
+			except OverflowError:
+				# negative for odd powers of negative numbers
+				value = -math.inf if left < 0 and right % 2 == 1 else math.inf
+			except ValueError:
+				raise ExprError('Result is not a number')
+	elif op == 'e':
+		try:
+			value = left * math.pow(10, right)
+		except OverflowError:
+			value = left * math.inf
+	elif op == 'round':
+		value = php_round(left, integer(right))
+	elif op == '=':
+		value = int(left == right)
+	elif op == '<':
+		value = int(left < right)
+	elif op == '>':
+		value = int(left > right)
+	elif op == '<=':
+		value = int(left <= right)
+	elif op == '>=':
+		value = int(left >= right)
+	elif op in ('<>', '!='):
+		value = int(left != right)
+	elif op == 'and':
+		value = int(bool(left) and bool(right))
+	else:  # or
+		value = int(bool(left) or bool(right))
+	if isinstance(value, float) and math.isnan(value):
+		raise ExprError('Result is not a number')
+	operands.append(value)
+
+def format_number(value):
+	"""
+	:return: the text of :param value: as printed by PHP, with 14 significant
+	digits, e.g. 0.33333333333333 or 1.0E+20.
+	"""
+	if isinstance(value, int):
+		return str(value)
+	if math.isinf(value):
+		return 'INF' if value > 0 else '-INF'
+	text = '%.14G' % value
+	if 'E' in text:
+		mantissa, exponent = text.split('E')
+		if '.' not in mantissa:
+			mantissa += '.0'
+		return '%sE%+d' % (mantissa, int(exponent))
+	return text
@@ -0,0 +1,108 @@
+import re
+from bisect import bisect_left
+
+from wikiextractor import constents
+from wikiextractor.utilities import dropSpans, findMatchingBraces, findNested, LRUCache
+
+# Text of a page where clean() does not look for discarded elements: comments,
+# dropped before, and the content of <syntaxhighlight>, left escaped.
+# Tags in the raw text of pages are escaped, e.g. &lt;ref&gt;.
+opaque = re.compile(r'(?:<|&lt;)!--.*?--(?:>|&gt;)|' + constents.syntaxhighlight.pattern, re.DOTALL)
+
+# the names in the template invocations in a text, at any level
+invocation = re.compile(r'{{\s*([^{|}]+)')
+
+class DiscardPruner():
+
+	"""
+	Removal from the raw text of a page of the elements that clean() discards
+	after expanding templates, e.g. <ref> and <gallery>, so that the templates
+	they contain are not expanded in vain.
+	An element is kept, and left to clean(), when dropping it first might
+	change the text outside it:
+	 - when it is within a template invocation, e.g. in an argument, or
+	   contains only part of one;
+	 - when a template it invokes contains tags of the same element;
+	 - when it overlaps another element without containing it.
+	"""
+
+	def __init__(self, size=10000):
+		"""
+		:param size: maximum number of templates whose tags are remembered.
+		"""
+		tags = '|'.join(constents.discardElements)
+		self.tagRE = re.compile(r'(?:<|&lt;)\s*/?\s*(%s)\b' % tags, re.IGNORECASE)
+		self.templateTagRE = re.compile(r'<\s*/?\s*(%s)\b' % tags, re.IGNORECASE)
+		self.templateTags = LRUCache(size)  # title -> discarded tags in its text
+		self.elements = 0  # elements dropped
+		self.templates = 0  # template invocations dropped with them
+
+	def prune(self, extractor, text):
+		"""
+		:param extractor: the Extractor of the page, resolving template titles.
+		:param text: raw text of the page, before expanding templates.
+		:return: the text without the discarded elements that can be dropped.
+		"""
+		# blank the opaque text, keeping the offsets
+		masked = opaque.sub(lambda m: ' ' * len(m.group()), text)
+		found = {tag.lower() for tag in self.tagRE.findall(masked)}
+		if not found:
+			return text
+		candidates = []
+		for tag in constents.discardElements:
+			if tag in found:
+				for s, e in findNested(masked,
+									   r'(?:<|&lt;)\s*%s\b(?:[^>/&]|&(?!gt;))*(?:>|&gt;)' % tag,
+									   r'(?:<|&lt;)\s*/\s*%s(?:>|&gt;)' % tag):
+					candidates.append((s, e, tag))
+		if not candidates:
+			return text
+		invocations = list(findMatchingBraces(text, 2))
+		starts = [s for s, _ in invocations]
+		spans = []
+		outer = 0  # end of the last element not nested in others
+		accepted = False  # whether that element is dropped
+		for s, e, tag in sorted(candidates, key=lambda c: (c[0], -c[1])):
+			if s < outer:
+				if e > outer:
+					# overlapping: keep both
+					if accepted:
+						spans.pop()
+						accepted = False
+					outer = e
+				continue  # nested: dropped with the outer one, if at all
+			outer = e
+			accepted = False
+			# invocations starting within it
+			first = bisect_left(starts, s)
+			last = bisect_left(starts, e, first)
+			if first and invocations[first - 1][1] > s:
+				continue  # within an invocation
+			if last > first and invocations[last - 1][1] > e:
+				continue  # with part of an invocation
+			if any(tag in self.tags(extractor, name) for name in invocation.findall(text, s, e)):
+				continue
+			spans.append((s, e, last - first))
+			accepted = True
+		for _, _, count in spans:
+			self.elements += 1
+			self.templates += count
+		return dropSpans([span[:2] for span in spans], text)
+
+	def tags(self, extractor, name):
+		"""
+		:return: the discarded tags in the text of the template invoked as
+		:param name:.
+		"""
+		title = extractor.titles.template(name.strip())
+		if not title:
+			return ()
+		tags = self.templateTags.get(title)
+		if tags is None:
+			tags = {tag.lower() for tag in self.templateTagRE.findall(constents.templates[title])}
+			self.templateTags[title] = tags
+		return tags
+
+	def stats(self):
+		""":return: the counters of the elements and invocations dropped."""
+		return {'elements': self.elements, 'templates': self.templates}
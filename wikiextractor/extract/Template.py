@@ -1,6 +1,15 @@
 import logging
 
-from wikiextractor.utilities import findMatchingBraces, splitParts
+from wikiextractor.utilities import findMatchingBraces, LRUCache, splitParts
+
+# approximate memory taken by a parsed template, per character of its text
+parsedBytesPerChar = 32
+# default memory for the parsed templates of a process, as --template-cache
+templateCacheBudget = 256 * 1024 ** 2
+
+def template_cache(budget):
+	""":return: a cache of parsed templates, taking about :param budget: bytes."""
+	return LRUCache(budget, sizeof=lambda template: template.size)
 
 class Template(list):
 	"""
@@ -21,8 +30,33 @@ class Template(list):
 			tpl.append(TemplateArg(body[s+3:e-3]))
 			start = e
 		tpl.append(TemplateText(body[start:])) # leftover
+		tpl.compile()
+		tpl.size = parsedBytesPerChar * len(body)
 		return tpl
 
+	def compile(self):
+		"""
+		Prepare the parts for subst(): empty text is dropped and adjacent text
+		merged, so that a template without arguments is just its text.
+		"""
+		ops = []
+		for part in self:
+			if isinstance(part, TemplateArg):
+				ops.append(part)
+			elif part:
+				if ops and isinstance(ops[-1], str):
+					ops[-1] += part
+				else:
+					ops.append(str(part))
+		self.ops = ops
+		# the text of a template without arguments, None otherwise
+		if not ops:
+			self.text = ''
+		elif len(ops) == 1 and isinstance(ops[0], str):
+			self.text = ops[0]
+		else:
+			self.text = None
+
 	def subst(self, params, extractor, depth=0):
 		# We perform parameter substitutions recursively.
 		# We also limit the maximum number of iterations to avoid too long or
@@ -42,9 +76,14 @@ class Template(list):
 
 		if depth > extractor.maxParameterRecursionLevels:
 			extractor.recursion_exceeded_3_errs += 1
+			if extractor.profile:
+				extractor.profile.recursion(extractor.frame)
 			return ''
 
-		return ''.join([tpl.subst(params, extractor, depth) for tpl in self])
+		if self.text is not None:
+			return self.text
+		return ''.join([op if op.__class__ is str else op.subst(params, extractor, depth)
+						for op in self.ops])
 
 	def __str__(self):
 		return ''.join([str(x) for x in self])
@@ -69,11 +108,15 @@ class TemplateArg():
 
 		parts = splitParts(parameter)
 		self.name = Template.parse(parts[0])
+		# a literal name, like 1 or title, needs no substitution nor expansion
+		self.literal = literal(self.name)
 		if len(parts) > 1:
 			# This parameter has a default value
 			self.default = Template.parse(parts[1])
+			self.constant = literal(self.default)
 		else:
 			self.default = None
+			self.constant = None
 
 	def __str__(self):
 		if self.default:
@@ -89,17 +132,28 @@ class TemplateArg():
 		"""
 		# the parameter name itself might contain templates, e.g.:
 		# appointe{{#if:{{{appointer14|}}}|r|d}}14|
-		paramName = self.name.subst(params, extractor, depth+1)
-		paramName = extractor.expandTemplates(paramName)
+		if self.literal is not None:
+			paramName = self.literal
+		else:
+			paramName = self.name.subst(params, extractor, depth+1)
+			paramName = extractor.expandTemplates(paramName)
 		res = ''
 		if paramName in params:
 			res = params[paramName]  # use parameter value specified in template invocation
+		elif self.constant is not None:
+			res = self.constant
 		elif self.default:            # use the default value
 			defaultValue = self.default.subst(params, extractor, depth+1)
 			res =  extractor.expandTemplates(defaultValue)
 		#logging.debug('subst arg %d %s -> %s' % (depth, paramName, res))
 		return res
 
+def literal(template):
+	""":return: the text of :param template: if it expands to itself, else None."""
+	if template.text is not None and '{{' not in template.text:
+		return template.text
+	return None
+
 # ======================================================================
 
 class TemplateText(str):
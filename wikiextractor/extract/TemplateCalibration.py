@@ -0,0 +1,110 @@
+from wikiextractor.utilities import LRUCache
+from .TemplatePolicy import TemplatePolicy
+from .extract import clean, compact, Extractor
+
+# fields of the record of a template
+SILENT, CONTRIBUTING = range(2)
+
+class TemplateCalibration():
+
+	"""
+	Learning of the templates that can be skipped, on a sample of the pages.
+	On each page sampled, the templates whose expansions, cleaned by
+	themselves, leave no text are dropped in further extractions of the page:
+	those whose absence does not change the text extracted are silent on the
+	page, the others contributing. Templates never contributing can be saved
+	as a skip list for TemplatePolicy.
+	"""
+
+	def __init__(self, sample=10):
+		"""
+		:param sample: calibrate on one page every :param sample:, by page id.
+		"""
+		self.sample = sample
+		self.pages = 0
+		self.records = {}  # title -> [pages where silent, pages where contributing]
+		self.silent = {}  # title -> whether its expansions on the page leave no text
+		self.visible = {}  # expansion -> whether it leaves text, on the page
+
+	def samples(self, id):
+		"""Whether to calibrate on the page with :param id:."""
+		return int(id) % self.sample == 0
+
+	def record(self, extractor, title, value):
+		"""Record an expansion :param value: of template :param title:."""
+		if self.silent.get(title, True):
+			visible = self.visible.get(value)
+			if visible is None:
+				text = compact(clean(extractor, value, html_safe=False))
+				visible = self.visible[value] = any(line.strip() for line in text)
+			self.silent[title] = not visible
+
+	def calibrate(self, extractor, text, html_safe=True):
+		"""
+		Extract :param text: with :param extractor:, calibrating on it.
+		:return: the text extracted.
+		"""
+		self.silent = {}
+		self.visible = {}
+		extractor.calibrating = True
+		try:
+			extracted = extractor.clean_text(text, html_safe=html_safe)
+		finally:
+			extractor.calibrating = False
+		candidates = sorted(title for title, silent in self.silent.items() if silent)
+		silent = self.droppable(extractor, text, html_safe, extracted, candidates)
+		for title in self.silent:
+			record = self.records.setdefault(title, [0, 0])
+			record[SILENT if title in silent else CONTRIBUTING] += 1
+		self.pages += 1
+		self.silent = {}
+		self.visible = {}
+		return extracted
+
+	def droppable(self, extractor, text, html_safe, extracted, titles):
+		"""
+		:return: the set of :param titles: that can be dropped from the page
+		without changing its :param extracted: text, bisecting them.
+		"""
+		if not titles:
+			return set()
+		if self.trial(extractor, text, html_safe, titles) == extracted:
+			return set(titles)
+		if len(titles) == 1:
+			return set()
+		half = len(titles) // 2
+		return (self.droppable(extractor, text, html_safe, extracted, titles[:half]) |
+				self.droppable(extractor, text, html_safe, extracted, titles[half:]))
+
+	def trial(self, extractor, text, html_safe, titles):
+		""":return: the text extracted from the page without the templates :param titles:."""
+		saved = Extractor.policy, Extractor.expansionCache, Extractor.profile, Extractor.pruner
+		policy = Extractor.policy or TemplatePolicy()
+		Extractor.policy = policy.extended(titles)
+		# neither reuse expansions nor disturb the counters
+		Extractor.expansionCache = LRUCache(0)
+		Extractor.profile = Extractor.pruner = None
+		try:
+			trial = Extractor(extractor.id, extractor.revid, '', extractor.title, extractor.page)
+			return trial.clean_text(text, html_safe=html_safe)
+		finally:
+			Extractor.policy, Extractor.expansionCache, Extractor.profile, Extractor.pruner = saved
+
+	def merge(self, pages, records):
+		"""Add the :param records: of another calibration on :param pages:."""
+		self.pages += pages
+		for title, other in records.items():
+			record = self.records.setdefault(title, [0, 0])
+			record[SILENT] += other[SILENT]
+			record[CONTRIBUTING] += other[CONTRIBUTING]
+
+	def skipped(self):
+		""":return: the titles of the templates that never contributed."""
+		return sorted(title for title, record in self.records.items() if not record[CONTRIBUTING])
+
+	def write(self, filename):
+		"""Write to :param filename: the skip list, for read_titles()."""
+		with open(filename, 'w', encoding='utf-8') as file:
+			file.write('# templates contributing no text to %d sampled pages\n' % self.pages)
+			for title in self.skipped():
+				file.write(title + '\n')
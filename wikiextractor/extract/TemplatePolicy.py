@@ -0,0 +1,45 @@
+from .TitleResolver import TitleResolver
+
+def read_titles(filename):
+	"""
+	:return: the template titles listed in :param filename:, one per line.
+	Empty lines and lines starting with # are ignored.
+	"""
+	with open(filename, encoding='utf-8') as file:
+		return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
+
+class TemplatePolicy():
+
+	"""
+	Choice of the templates not to expand: their invocations are dropped.
+	Templates in the skip list are dropped, unless in the keep list.
+	Titles are given as in invocations, e.g. 'reflist' or 'Template:Reflist',
+	and resolved on first use, when the template namespace and the redirects
+	are known: redirects to a template are dropped with it.
+	"""
+
+	def __init__(self, skip=(), keep=()):
+		"""
+		:param skip: titles of the templates to drop.
+		:param keep: titles of the templates to expand anyway.
+		"""
+		self.skip = list(skip)
+		self.keep = list(keep)
+		self.skipped = None  # resolved titles
+
+	def skips(self, title):
+		"""Whether to drop the template with the resolved :param title:."""
+		if self.skipped is None:
+			resolver = TitleResolver()
+			resolve = lambda names: {resolver.template(name) for name in names} - {None, ''}
+			self.skipped = resolve(self.skip) - resolve(self.keep)
+		return title in self.skipped
+
+	def skips_any(self, titles):
+		"""Whether to drop any of the templates with the resolved :param titles:."""
+		return any(self.skips(title) for title in titles)
+
+	def extended(self, skip):
+		""":return: a policy dropping also the templates :param skip:."""
+		return TemplatePolicy(self.skip + list(skip), self.keep)
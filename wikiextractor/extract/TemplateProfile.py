@@ -0,0 +1,80 @@
+import json
+from timeit import default_timer
+
+# fields of the record of a template
+CALLS, CUMULATIVE, SELF, BYTES, DEPTH, RECURSION = range(6)
+fields = ('calls', 'cumulative', 'self', 'bytes', 'max_depth', 'recursion')
+
+class TemplateProfile():
+
+	"""
+	Cost of the expansion of each template, recorded when profiling:
+	 - calls: number of invocations;
+	 - cumulative: seconds spent, including the templates it includes;
+	 - self: seconds spent, excluding the templates it includes;
+	 - bytes: characters produced;
+	 - max_depth: maximum nesting level of its invocations;
+	 - recursion: times a recursion limit was hit within it.
+	"""
+
+	def __init__(self):
+		self.records = {}  # title -> list of fields
+		self.children = []  # time spent in the invocations nested in those open
+
+	def record(self, title):
+		record = self.records.get(title)
+		if record is None:
+			record = self.records[title] = [0, 0.0, 0.0, 0, 0, 0]
+		return record
+
+	def start(self):
+		""":return: the start time of an invocation."""
+		self.children.append(0.0)
+		return default_timer()
+
+	def stop(self, title, start, depth, value):
+		"""
+		Record the invocation of template :param title: begun at :param start:.
+		:param depth: nesting level of the invocation.
+		:param value: its expansion.
+		"""
+		elapsed = default_timer() - start
+		children = self.children.pop()
+		if self.children:
+			self.children[-1] += elapsed
+		record = self.record(title)
+		record[CALLS] += 1
+		record[CUMULATIVE] += elapsed
+		record[SELF] += elapsed - children
+		record[BYTES] += len(value)
+		record[DEPTH] = max(record[DEPTH], depth)
+
+	def recursion(self, frame):
+		"""Record a recursion limit hit within the innermost template of :param frame:."""
+		if frame:
+			self.record(frame[-1][0])[RECURSION] += 1
+
+	def merge(self, records):
+		"""Add the :param records: of another profile."""
+		for title, other in records.items():
+			record = self.record(title)
+			for i in range(len(fields)):
+				if i == DEPTH:
+					record[i] = max(record[i], other[i])
+				else:
+					record[i] += other[i]
+
+	def write(self, filename):
+		"""
+		Write the records to :param filename:, most expensive first: as JSON
+		if its name ends with .json, otherwise as tab separated values.
+		"""
+		records = sorted(self.records.items(), key=lambda r: r[1][SELF], reverse=True)
+		with open(filename, 'w', encoding='utf-8') as file:
+			if filename.endswith('.json'):
+				json.dump([dict(title=title, **dict(zip(fields, record))) for title, record in records],
+						  file, ensure_ascii=False, indent=1)
+			else:
+				file.write('title\t%s\n' % '\t'.join(fields))
+				for title, record in records:
+					file.write('%s\t%d\t%.6f\t%.6f\t%d\t%d\t%d\n' % (title, *record))
@@ -0,0 +1,100 @@
+import logging
+
+from wikiextractor import constents
+from wikiextractor.utilities import LRUCache, normalizeNamespace, normalizeTitle
+
+# marks the titles not resolved yet, since None marks invalid ones
+unresolved = object()
+
+def flatten_redirects(redirects):
+	"""
+	Resolve chains of redirects, so that a single lookup reaches the page.
+	:param redirects: dict from title to the target of its redirect, as written.
+	:return: dict from title to the normalized title of the last page of its
+	chain. Titles in a cycle of redirects are dropped.
+	"""
+	flat = {}
+	for title in redirects:
+		chain = []
+		target = title
+		while target in redirects and target not in flat:
+			if target in chain:
+				logging.warning('Redirect cycle: %s', ' -> '.join(chain + [target]))
+				target = None
+				break
+			chain.append(target)
+			target = normalizeTitle(redirects[target])
+		if target in flat:
+			target = flat[target]
+		for title in chain:
+			flat[title] = target
+	return {title: target for title, target in flat.items() if target}
+
+
+class TitleResolver():
+
+	"""
+	Resolution of the titles of included templates and of links to their
+	pages: titles are normalized, and redirects followed, once. Both found
+	and missing titles are remembered, up to a limit.
+	Redirects are expected to be flattened by flatten_redirects().
+	"""
+
+	def __init__(self, size=10000):
+		"""
+		:param size: maximum number of titles remembered, of each kind.
+		"""
+		self.templates = LRUCache(size)
+		self.links = LRUCache(size)
+
+	def template(self, title):
+		"""
+		:param title: title in a template invocation, e.g. 'cite_web'.
+		:return: the title of the page to include, e.g. 'Template:Cite web',
+		'' if there is no such template, or None if the title is invalid.
+		"""
+		resolved = self.templates.get(title, unresolved)
+		if resolved is unresolved:
+			resolved = self.resolveTemplate(title)
+			self.templates[title] = resolved
+		return resolved
+
+	def resolveTemplate(self, title):
+		title = self.qualify(title)
+		if not title:
+			return None
+		title = constents.redirects.get(title, title)
+		return title if title in constents.templates else ''
+
+	def qualify(self, title):
+		"""
+		:return: the normalized title of the page included by an invocation of
+		:param title:, in the template namespace unless another is given.
+		"""
+		if title.startswith(':'):
+			# leading colon by itself implies the main namespace
+			title = title[1:]
+		elif title.strip(' _'):
+			prefix, colon, _ = title.partition(':')
+			if not (colon and normalizeNamespace(prefix.strip(' _')) in constents.knownNamespaces):
+				# the default namespace of inclusions
+				if constents.templateNamespace:
+					title = constents.templateNamespace + ':' + title
+		return normalizeTitle(title)
+
+	def link(self, title):
+		"""
+		:param title: target of an internal link.
+		:return: the normalized title of the page linked, after redirects.
+		"""
+		resolved = self.links.get(title)
+		if resolved is None:
+			resolved = normalizeTitle(title)
+			resolved = constents.redirects.get(resolved, resolved)
+			self.links[title] = resolved
+		return resolved
+
+	def clear(self):
+		"""Forget the titles resolved, e.g. when the templates change."""
+		self.templates = LRUCache(self.templates.maxsize)
+		self.links = LRUCache(self.links.maxsize)
@@ -3,9 +3,9 @@ from urllib.parse import quote, urlencode
 from sys import modules
 from wikiextractor import constents
 from .Template import Template
-from .Infix import Infix
 from .MagicWords import MagicWords
-from wikiextractor.utilities import dropNested, dropSpans, findBalanced, findMatchingBraces, get_url, lcfirst, normalizeNamespace, sharp_expr, sharp_if, sharp_switch, splitParts, ucfirst, unescape
+from .TitleResolver import TitleResolver
+from wikiextractor.utilities import dropNested, dropSpans, findBalanced, findMatchingBraces, get_url, lcfirst, LRUCache, sharp_expr, sharp_if, sharp_ifexpr, sharp_switch, splitParts, ucfirst, unescape
 def clean(extractor, text, expand_templates=False, html_safe=True):
 	"""
 	Transforms wiki markup. If the command line flag --escapedoc is set then the text is also escaped
@@ -19,6 +19,9 @@ def clean(extractor, text, expand_templates=False, html_safe=True):
 	if expand_templates:
 		# expand templates
 		# See: http://www.mediawiki.org/wiki/Help:Templates
+		if extractor.pruner:
+			# drop first the elements discarded below, with their templates
+			text = extractor.pruner.prune(extractor, text)
 		text = extractor.expandTemplates(text)
 	else:
 		# Drop transclusions (template, parser functions)
@@ -305,7 +308,7 @@ def makeInternalLink(title, label):
 		if colon2 > 1 and title[colon + 1:colon2] not in constents.acceptedNamespaces:
 			return ''
 	if Extractor.keepLinks:
-		return '<a href="%s">%s</a>' % (quote(title), label)
+		return '<a href="%s">%s</a>' % (quote(Extractor.titles.link(title)), label)
 	else:
 		return label
 # ----------------------------------------------------------------------
@@ -403,6 +406,19 @@ class Extractor():
 	to_json = False
 	# Obtained from TemplateNamespace
 	templatePrefix = ''
+	# Expansions of templates, keyed on title and expanded parameters, shared
+	# by the pages handled in a process.
+	expansionCache = LRUCache(10000)
+	# Resolution of the titles of templates and links.
+	titles = TitleResolver()
+	# TemplateProfile recording the cost of templates, when profiling.
+	profile = None
+	# DiscardPruner dropping discarded elements before expanding templates.
+	pruner = None
+	# TemplatePolicy choosing the templates not to expand.
+	policy = None
+	# TemplateCalibration learning the templates that can be skipped.
+	calibration = None
 	def __init__(self, id, revid, urlbase, title, page):
 		"""param page: a list of lines."""
 		self.id = id
@@ -416,11 +432,24 @@ class Extractor():
 		self.recursion_exceeded_2_errs = 0  # template recursion within expandTemplate()
 		self.recursion_exceeded_3_errs = 0  # parameter recursion
 		self.template_title_errs = 0
+		# whether the current expansion depends on the page, e.g. on PAGENAME
+		self.dependent = False
+		# whether the expansions are recorded by Extractor.calibration
+		self.calibrating = False
+		# optional set where to record the titles of the templates expanded
+		self.included = None
 	def clean_text(self, text, mark_headers=False, expand_templates=True, html_safe=True):
 		"""
 		:param mark_headers: True to distinguish headers from paragraphs
 		  e.g. "## Section 1"
 		"""
+		self.setMagicWords()
+		text = clean(self, text, expand_templates=expand_templates,
+					 html_safe=html_safe)
+		text = compact(text, mark_headers=mark_headers)
+		return text
+	def setMagicWords(self):
+		"""Set the magic words that depend on the page."""
 		self.magicWords['namespace'] = self.title[:max(0, self.title.find(":"))]
 		#self.magicWords['namespacenumber'] = '0' # for article, 
 		self.magicWords['pagename'] = self.title
@@ -430,10 +459,6 @@ class Extractor():
 		self.magicWords['currentday'] = time.strftime('%d')
 		self.magicWords['currenthour'] = time.strftime('%H')
 		self.magicWords['currenttime'] = time.strftime('%H:%M:%S')
-		text = clean(self, text, expand_templates=expand_templates,
-					 html_safe=html_safe)
-		text = compact(text, mark_headers=mark_headers)
-		return text
 	def extract(self, out, html_safe=True):
 		"""
 		:param out: a memory file.
@@ -441,7 +466,10 @@ class Extractor():
 		"""
 		logging.debug("%s\t%s", self.id, self.title)
 		text = ''.join(self.page)
-		text = self.clean_text(text, html_safe=html_safe)
+		if self.calibration and self.calibration.samples(self.id):
+			text = self.calibration.calibrate(self, text, html_safe=html_safe)
+		else:
+			text = self.clean_text(text, html_safe=html_safe)
 		if self.to_json:
 			json_data = {
 		'id': self.id,
@@ -495,6 +523,9 @@ class Extractor():
 		res = ''
 		if len(self.frame) >= self.maxTemplateRecursionLevels:
 			self.recursion_exceeded_1_errs += 1
+			self.dependent = True
+			if Extractor.profile:
+				Extractor.profile.recursion(self.frame)
 			return res
 		# logging.debug('<expandTemplates ' + str(len(self.frame)))
 		cur = 0
@@ -601,6 +632,9 @@ class Extractor():
 		# equals sign are indexed 1, 2, .., given as attribute in the <name> tag.
 		if len(self.frame) >= self.maxTemplateRecursionLevels:
 			self.recursion_exceeded_2_errs += 1
+			self.dependent = True
+			if Extractor.profile:
+				Extractor.profile.recursion(self.frame)
 			# logging.debug('   INVOCATION> %d %s', len(self.frame), body)
 			return ''
 		logging.debug('INVOCATION %d %s', len(self.frame), body)
@@ -618,6 +652,8 @@ class Extractor():
 			title = re.sub(substWords, '', title, 1, re.IGNORECASE)
 			subst = True
 		if title.lower() in self.magicWords.values:
+			if title != '!':
+				self.dependent = True
 			return self.magicWords[title.lower()]
 		# Parser functions
 		# The first argument is everything after the first colon.
@@ -625,28 +661,55 @@ class Extractor():
 		colon = title.find(':')
 		if colon > 1:
 			funct = title[:colon]
+			if funct == '#invoke':
+				# modules see the parameters of the enclosing templates
+				self.dependent = True
 			parts[0] = title[colon + 1:].strip()  # side-effect (parts[0] not used later)
 			# arguments after first are not evaluated
 			ret = callParserFunction(funct, parts, self.frame)
 			return self.expandTemplates(ret)
-		title = fullyQualifiedTemplateTitle(title)
-		if not title:
+		title = Extractor.titles.template(title)
+		if title is None:
 			self.template_title_errs += 1
 			return ''
-		redirected = constents.redirects.get(title)
-		if redirected:
-			title = redirected
+		if not title:
+			# The page being included could not be identified
+			return ''
+		if Extractor.policy and Extractor.policy.skips(title):
+			return ''
+		if self.included is not None:
+			self.included.add(title)
+		if Extractor.profile:
+			start = Extractor.profile.start()
+			value = self.instantiate(title, parts, subst)
+			Extractor.profile.stop(title, start, len(self.frame), value)
+		else:
+			value = self.instantiate(title, parts, subst)
+		if self.calibrating:
+			Extractor.calibration.record(self, title, value)
+		return value
+	def instantiate(self, title, parts, subst):
+		"""
+		Expand the invocation of a template.
+		:param title: the resolved title of the template.
+		:param parts: the parts of the invocation, parameters after the first.
+		:param subst: whether the parameters are to be left unexpanded.
+		"""
+		# expanded at load time, whatever the parameters, unless it includes
+		# templates to skip
+		value = constents.constantTemplates.get(title)
+		if value is not None:
+			if not Extractor.policy:
+				return value
+			includes = constents.constantIncludes.get(title)
+			if not (includes and Extractor.policy.skips_any(includes.split('\n'))):
+				return value
 		# get the template
-		if title in constents.templateCache:
-			template = constents.templateCache[title]
-		elif title in constents.templates:
+		template = constents.templateCache.get(title)
+		if template is None:
 			template = Template.parse(constents.templates[title])
 			# add it to cache
 			constents.templateCache[title] = template
-			del constents.templates[title]
-		else:
-			# The page being included could not be identified
-			return ''
 		# logging.debug('TEMPLATE %s: %s', title, template)
 		# tplarg          = "{{{" parts "}}}"
 		# parts           = [ title *( "|" part ) ]
@@ -680,6 +743,14 @@ class Extractor():
 			params = [self.expandTemplates(p) for p in params]
 		# build a dict of name-values for the parameter values
 		params = self.templateParams(params)
+		# The same invocation gives the same expansion, unless something
+		# specific to the page was involved.
+		key = (title, subst, tuple(sorted(params.items())))
+		value = Extractor.expansionCache.get(key)
+		if value is not None:
+			return value
+		dependent = self.dependent
+		self.dependent = False
 		# Perform parameter substitution
 		# extend frame before subst, since there may be recursion in default
 		# parameter value, e.g. {{OTRS|celebrative|date=April 2015}} in article
@@ -689,43 +760,15 @@ class Extractor():
 		# logging.debug('instantiated %d %s', len(self.frame), instantiated)
 		value = self.expandTemplates(instantiated)
 		self.frame.pop()
+		if not self.dependent:
+			Extractor.expansionCache[key] = value
+		self.dependent = dependent or self.dependent
 		# logging.debug('   INVOCATION> %s %d %s', title, len(self.frame), value)
 		return value
-def fullyQualifiedTemplateTitle(templateTitle):
-	"""
-	Determine the namespace of the page being included through the template
-	mechanism
-	"""
-	if templateTitle.startswith(':'):
-		# Leading colon by itself implies main namespace, so strip this colon
-		return ucfirst(templateTitle[1:])
-	else:
-		m = re.match('([^:]*)(:.*)', templateTitle)
-		if m:
-			# colon found but not in the first position - check if it
-			# designates a known namespace
-			prefix = normalizeNamespace(m.group(1))
-			if prefix in constents.knownNamespaces:
-				return prefix + ucfirst(m.group(2))
-	# The title of the page being included is NOT in the main namespace and
-	# lacks any other explicit designation of the namespace - therefore, it
-	# is resolved to the Template namespace (that's the default for the
-	# template inclusion mechanism).
-	# This is a defense against pages whose title only contains UTF-8 chars
-	# that are reduced to an empty string. Right now I can think of one such
-	# case - <C2><A0> which represents the non-breaking space.
-	# In this particular case, this page is a redirect to [[Non-nreaking
-	# space]], but having in the system a redirect page with an empty title
-	# causes numerous problems, so we'll live happier without it.
-	if templateTitle:
-		return Extractor.templatePrefix + ucfirst(templateTitle)
-	else:
-		return ''  # caller may log as error
 # ----------------------------------------------------------------------
 # Parser functions
 # see http://www.mediawiki.org/wiki/Help:Extension:ParserFunctions
 # https://github.com/Wikia/app/blob/dev/extensions/ParserFunctions/ParserFunctions_body.php
-ROUND = Infix(lambda x, y: round(x, y))
 def sharp_ifeq(lvalue, rvalue, valueIfTrue, valueIfFalse=None, *args):
 	rvalue = rvalue.strip()
 	if rvalue:
@@ -756,8 +799,8 @@ def sharp_invoke(module, function, frame):
 		if funct:
 			# find parameters in frame whose title is the one of the original
 			# template invocation
-			templateTitle = fullyQualifiedTemplateTitle(function)
-			if not templateTitle:
+			templateTitle = Extractor.titles.template(function)
+			if templateTitle is None:
 				logging.warn("Template with empty title")
 			pair = next((x for x in frame if x[0] == templateTitle), None)
 			if pair:
@@ -773,7 +816,7 @@ parserFunctions = {
 	'#if': sharp_if,
 	'#ifeq': sharp_ifeq,
 	'#iferror': sharp_iferror,
-	'#ifexpr': lambda *args: '',  # not supported
+	'#ifexpr': sharp_ifexpr,
 	'#ifexist': lambda *args: '',  # not supported
 	'#rel2abs': lambda *args: '',  # not supported
 	'#switch': sharp_switch,
@@ -817,14 +860,31 @@ def callParserFunction(functionName, args, frame):
 def define_template(title, page):
 	"""
 	Adds a template defined in the :param page:.
-	@see https://en.wikipedia.org/wiki/Help:Template#Noinclude.2C_includeonly.2C_and_onlyinclude
+	"""
+	add_template(title, *template_definition(page))
+def add_template(title, redirect, text):
+	"""
+	Adds a template from its template_definition().
 	"""
 	# title = normalizeTitle(title)
+	if redirect:
+		constents.redirects[title] = redirect
+		return
+	if text:
+		if title in constents.templates and constents.templates[title] != text:
+			logging.warn('Redefining: %s', title)
+		constents.templates[title] = text
+def template_definition(page):
+	"""
+	Clean the text of a template in the :param page:, for inclusion.
+	:return: pair (redirect, text) of the target of the page if it is a
+	redirect, or else None and the text.
+	@see https://en.wikipedia.org/wiki/Help:Template#Noinclude.2C_includeonly.2C_and_onlyinclude
+	"""
 	# check for redirects
 	m = re.match('#REDIRECT.*?\[\[([^\]]*)]]', page[0], re.IGNORECASE)
 	if m:
-		constents.redirects[title] = m.group(1)  # normalizeTitle(m.group(1))
-		return
+		return m.group(1), None  # normalizeTitle(m.group(1))
 	text = unescape(''.join(page))
 	# We're storing template text for future inclusion, therefore,
 	# remove all <noinclude> text and keep all <includeonly> text
@@ -848,7 +908,4 @@ def define_template(title, page):
 		text = onlyincludeAccumulator
 	else:
 		text = constents.reIncludeonly.sub('', text)
-	if text:
-		if title in constents.templates and constents.templates[title] != text:
-			logging.warn('Redefining: %s', title)
-		constents.templates[title] = text
+	return None, text
@@ -30,7 +30,7 @@ Extracts a single page from a Wikipedia dump file.
 import sys, os.path
 import re
 import argparse
-import bz2
+import mmap
 
 
 # Program version
@@ -50,10 +50,12 @@ def process_data(input_file, id, templates=False):
     :param templates: whether article is a template.
     """
 
-    if input_file.lower().endswith(".bz2"):
-        input = bz2.open(input_file, mode='rt', encoding='utf-8')
+    from wikiextractor.utilities import decode_open, file_codec
+    if file_codec(input_file):
+        input = decode_open(input_file)
     else:
-        input = open(input_file)
+        mmap_data(input_file, id, templates)
+        return
 
     page = []
     for line in input:
@@ -97,6 +99,29 @@ def process_data(input_file, id, templates=False):
 
     input.close()
 
+def mmap_data(input_file, id, templates=False):
+    """
+    Same as process_data(), for an uncompressed dump, splitting it into pages
+    at the byte level.
+    """
+    from wikiextractor.page_splitter import scan_pages
+
+    with open(input_file, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for begin, end, title, _, curid, _, _, _, _ in scan_pages(buf):
+                if templates:
+                    if not title.startswith('Template:'):
+                        continue
+                elif curid != id:
+                    continue
+                # whole lines, as in process_data()
+                begin = buf.rfind(b'\n', 0, begin) + 1
+                nl = buf.find(b'\n', end)
+                end = nl + 1 if nl >= 0 else len(buf)
+                print(buf[begin:end].decode('utf-8'))
+                if not templates:
+                    break
+
 def main():
     parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]),
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -107,13 +132,22 @@ def main():
                         help="article number")
     parser.add_argument("--template", action="store_true",
                         help="whether article is a template")
+    parser.add_argument("--index",
+                        help="page index of the dump, built with pageIndex, to seek directly to the article")
     parser.add_argument("-v", "--version", action="version",
                         version='%(prog)s ' + __version__,
                         help="print program version")
 
     args = parser.parse_args()
 
-    process_data(args.input, args.id, args.template)
+    if args.index and not args.template:
+        from wikiextractor.page_index import read_page
+
+        page = read_page(args.input, args.index, args.id)
+        if page:
+            print(page)
+    else:
+        process_data(args.input, args.id, args.template)
 
 if __name__ == '__main__':
     main()
@@ -9,7 +9,9 @@ def extract_info(input ):
 		if not m:
 			continue
 		tag = m.group(2)
-		if tag == 'base':
+		if tag == 'dbname':
+			constents.dbname = m.group(3)
+		elif tag == 'base':
 			# discover urlbase from the xml dump file
 			# /mediawiki/siteinfo/base
 			base = m.group(3)
@@ -1,22 +1,62 @@
+from bisect import bisect_left
+from collections import deque
 import logging
+from multiprocessing import get_context
+import re
 from wikiextractor import constents
-from wikiextractor.extract.extract import Extractor, define_template
+from wikiextractor.extract.Template import Template, TemplateArg
+from wikiextractor.extract.TitleResolver import flatten_redirects
+from wikiextractor.extract.extract import Extractor, add_template, define_template, template_definition
+from wikiextractor.utilities import LRUCache
 
 
-def load_templates(file, output_file=None):
+def load_templates(file, output_file=None, spool=None, processes=0):
 	"""
 	Load templates from :param file:.
 	:param output_file: file where to save templates and modules.
+	:param spool: optional file where to copy the pages to be extracted.
+	:param processes: number of processes cleaning the templates.
 	:return: number of templates loaded.
 	"""
-	articles = 0
-	templates = 0
+	return define_templates(template_pages(file, not output_file, spool), output_file, processes)
+
+def template_pages(file, discover_namespace=False, spool=None):
+	"""
+	Collect the pages in :param file:.
+	:param discover_namespace: whether to reconstruct the template namespace
+	from the first title, if it is not known yet.
+	:param spool: optional file where to copy verbatim the pages that might be
+	extracted, so that a second pass need not read :param file: again.
+	:return: an iterator over pairs (title, page), where page is a list of lines.
+	Of pages with several revisions, the newest is used, like in collect_pages(),
+	and only that one is copied to the spool: the lines of the others are
+	dropped while reading.
+	"""
 	page = []
 	inText = False
-	if output_file:
-		output = open(output_file, 'w',encoding='utf-8')
+	timestamp = None
+	pageFilter = constents.pageFilter
+	timeFilter = pageFilter and pageFilter.has_timestamp()
+	header = None  # lines of the page before its title, for the spool
+	spooled = False  # whether the page is copied to the spool
+	revision = None  # lines of the current revision, for the spool
+	accepted = True  # whether the current revision is within the time window
+	chosen = None  # lines of the newest revision accepted, not yet spooled
 	for line in file:
 		#line = line.decode('utf-8')
+		if spooled:
+			if revision is not None:
+				revision.append(line)
+			elif '<revision' in line:  # a tag, since the text of pages is escaped
+				revision = [line]
+				accepted = True
+			else:
+				if chosen:
+					spool.write(''.join(chosen))
+					chosen = None
+				spool.write(line)
+		elif header is not None:
+			header.append(line)
 		if '<' not in line:  # faster than doing re.search()
 			if inText:
 				page.append(line)
@@ -27,49 +67,237 @@ def load_templates(file, output_file=None):
 		tag = m.group(2)
 		if tag == 'page':
 			page = []
+			header = [line] if spool else None
+			spooled = False
+			revision = chosen = None
 		elif tag == 'title':
 			title = m.group(3)
-			if not output_file and not constents.templateNamespace:  # do not know it yet
+			if header is not None:
+				colon = title.find(':')
+				spooled = colon < 0 or title[:colon] in constents.acceptedNamespaces
+				if spooled:
+					spool.write(''.join(header))
+				header = None
+			if discover_namespace and not constents.templateNamespace:  # do not know it yet
 				# we reconstruct it from the first title
 				colon = title.find(':')
 				if colon > 1:
 					constents.templateNamespace = title[:colon]
 					Extractor.templatePrefix = title[:colon + 1]
 			# FIXME: should reconstruct also moduleNamespace
+		elif tag == 'timestamp':
+			timestamp = m.group(3)
 		elif tag == 'text':
+			if timeFilter and not pageFilter.accept_timestamp(timestamp or ''):
+				accepted = False
+				continue  # the lines of its text are skipped as not in text
+			page = []  # replace the previous revision
+			if line[m.start(3) - 2] == '/':  # empty <text/>
+				continue
 			inText = True
 			line = line[m.start(3):m.end(3)]
 			page.append(line)
 			if m.lastindex == 4:  # open-close
 				inText = False
 		elif tag == '/text':
-			if m.group(1):
+			if m.group(1) and inText:
 				page.append(m.group(1))
 			inText = False
 		elif inText:
 			page.append(line)
+		elif tag == '/revision':
+			if revision is not None:
+				if accepted:
+					chosen = revision  # replace the previous one
+				revision = None
 		elif tag == '/page':
-			if title.startswith(Extractor.templatePrefix):
-				define_template(title, page)
-				templates += 1
-			# save templates and modules to file
-			if output_file and (title.startswith(Extractor.templatePrefix) or
-								title.startswith(constents.modulePrefix)):
-				output.write('<page>\n')
-				output.write('   <title>%s</title>\n' % title)
-				output.write('   <ns>10</ns>\n')
-				output.write('   <text>')
-				for line in page:
-					output.write(line)
-				output.write('   </text>\n')
-				output.write('</page>\n')
+			spooled = False
+			yield title, page
 			page = []
-			articles += 1
-			if articles % 100000 == 0:
-				logging.info("Preprocessed %d pages", articles)
+
+# templates sent at once to a cleaning process
+templateBatch = 256
+
+def template_definitions(batch):
+	"""
+	Clean a batch of templates, in a process of the pool of define_templates().
+	:param batch: list of pairs (title, page).
+	:return: list of tuples (title, redirect, text) for add_template().
+	"""
+	return [(title,) + template_definition(page) for title, page in batch]
+
+def define_templates(pages, output_file=None, processes=0):
+	"""
+	Define the templates among :param pages:.
+	:param pages: an iterator over pairs (title, page).
+	:param output_file: file where to save templates and modules.
+	:param processes: number of processes cleaning the templates, while this
+	one keeps reading the pages. Definitions are added in the order of the
+	pages anyway.
+	:return: number of templates loaded.
+	"""
+	articles = 0
+	templates = 0
+	if output_file:
+		output = open(output_file, 'w',encoding='utf-8')
+	pool = get_context('spawn').Pool(processes) if processes > 1 else None
+	pending = deque()  # results of the batches sent to the pool, in order
+	batch = []
+	for title, page in pages:
+		if title.startswith(Extractor.templatePrefix) and page:
+			if pool:
+				batch.append((title, page))
+				if len(batch) == templateBatch:
+					pending.append(pool.apply_async(template_definitions, (batch,)))
+					batch = []
+					# bound the pages in flight
+					while len(pending) > 2 * processes:
+						for definition in pending.popleft().get():
+							add_template(*definition)
+			else:
+				define_template(title, page)
+			templates += 1
+		# save templates and modules to file
+		if output_file and (title.startswith(Extractor.templatePrefix) or
+							title.startswith(constents.modulePrefix)):
+			output.write('<page>\n')
+			output.write('   <title>%s</title>\n' % title)
+			output.write('   <ns>10</ns>\n')
+			output.write('   <text>')
+			for line in page:
+				output.write(line)
+			output.write('   </text>\n')
+			output.write('</page>\n')
+		articles += 1
+		if articles % 100000 == 0:
+			logging.info("Preprocessed %d pages", articles)
+	if pool:
+		pending.append(pool.apply_async(template_definitions, (batch,)))
+		while pending:
+			for definition in pending.popleft().get():
+				add_template(*definition)
+		pool.close()
+		pool.join()
 	if output_file:
 		output.close()
 		logging.info("Saved %d templates to '%s'", templates, output_file)
+	constents.redirects = flatten_redirects(constents.redirects)
+	Extractor.titles.clear()
 	return templates
 
+def constant_templates(titles=None):
+	"""
+	Expand the templates defined, whose expansion is the same in every page:
+	those without parameters, that depend on the page neither directly, e.g.
+	through PAGENAME, nor through the templates they include.
+	The templates that each includes are recorded in constents.constantIncludes.
+	:param titles: optional titles of the templates to consider, otherwise all.
+	:return: dict from template title to its expansion.
+	"""
+	# the ones found are used in expanding the following ones
+	constants = constents.constantTemplates = {}
+	includes = constents.constantIncludes = {}
+	# expanded with all the templates, since the store may serve runs with
+	# other policies, and neither profiled, calibrated nor cached
+	saved = Extractor.policy, Extractor.profile, Extractor.calibration, Extractor.expansionCache
+	Extractor.policy = Extractor.profile = Extractor.calibration = None
+	Extractor.expansionCache = LRUCache(0)
+	try:
+		probe = Extractor(0, 0, '', '', [])
+		probe.setMagicWords()
+		for title in constents.templates if titles is None else sorted(titles):
+			text = constents.templates[title]
+			if '{{' not in text:
+				continue  # nothing to expand
+			if '{{{' in text and any(isinstance(part, TemplateArg) for part in Template.parse(text)):
+				continue
+			probe.dependent = False
+			probe.included = set()
+			probe.frame.append((title, {}))
+			value = probe.expandTemplates(text)
+			probe.frame.pop()
+			if not probe.dependent:
+				constants[title] = value
+				included = set(probe.included)
+				for other in probe.included:
+					if other in includes:  # a constant served whole
+						included.update(includes[other].split('\n'))
+				includes[title] = '\n'.join(sorted(included))
+	finally:
+		Extractor.policy, Extractor.profile, Extractor.calibration, Extractor.expansionCache = saved
+	return constants
 
+# the opening braces and the name of an invoked template, up to a parameter,
+# the end of the invocation or a brace, which begins a computed part of the name
+reInvocation = re.compile(r'(?<!{)({{2,})\s*([^{}|\[\]<>\n#]*?)\s*({|\||}})')
+reSubst = re.compile(r'\s*(?:safe)?subst:', re.IGNORECASE)
+# the idiom {{{|safesubst:}}}, a parameter never given, expanding to its default
+reSubstArg = re.compile(r'{{{\s*\|\s*(?:safe)?subst:\s*}}}', re.IGNORECASE)
+
+def invocations(text):
+	"""
+	:return: an iterator over pairs (name, computed) for the templates
+	invoked in :param text:. Of names computed from parameters or other
+	templates, e.g. {{country_{{{1}}}}}, name is their fixed beginning,
+	which is empty for names entirely computed, e.g. {{ {{{1}}} }}.
+	"""
+	for m in reInvocation.finditer(reSubstArg.sub('', text)):
+		braces = len(m.group(1))
+		if braces in (3, 4, 6):
+			continue  # a parameter, e.g. {{{1}}}, or { {{{1}}} }
+		if braces > 2:
+			# a template named by a parameter, e.g. {{{{{1}}}}}
+			yield '', True
+			continue
+		name = reSubst.sub('', m.group(2), 1)
+		if name.find(':') > 1:
+			continue  # parser function, like in Extractor.expandTemplate()
+		yield name, m.group(3) == '{'
+
+def invoked_titles(text, names):
+	"""
+	:return: an iterator over the titles of the templates that the invocations
+	in :param text: may include, following redirects.
+	:param names: sorted titles of the templates and of the redirects, where
+	to look for those beginning like computed names.
+	"""
+	for name, computed in invocations(text):
+		if computed:
+			prefix = Extractor.titles.qualify(name)
+			i = bisect_left(names, prefix)
+			while i < len(names) and names[i].startswith(prefix):
+				title = constents.redirects.get(names[i], names[i])
+				if title in constents.templates:
+					yield title
+				i += 1
+		else:
+			title = Extractor.titles.template(name)
+			if title:
+				yield title
+
+def reachable_templates(pages):
+	"""
+	Find the templates that the extraction of :param pages: may include,
+	directly or through other templates.
+	Of computed names, all the templates beginning like them are taken.
+	:param pages: an iterator over the texts of the pages to be extracted.
+	:return: set of template titles.
+	"""
+	names = sorted(set(constents.templates) | set(constents.redirects))
+	reached = set()
+	todo = []
+	for text in pages:
+		for title in invoked_titles(text, names):
+			if title not in reached:
+				reached.add(title)
+				todo.append(title)
+		if len(reached) == len(constents.templates):
+			break
+	while todo and len(reached) < len(constents.templates):
+		for title in invoked_titles(constents.templates[todo.pop()], names):
+			if title not in reached:
+				reached.add(title)
+				todo.append(title)
+	if len(reached) == len(constents.templates):
+		logging.info('All templates may be included, e.g. by invocations with names entirely computed')
+	return reached
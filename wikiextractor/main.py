@@ -1,13 +1,22 @@
 from multiprocessing import freeze_support
 import logging
 import os
+import re
 import sys
 from wikiextractor import constents
 from wikiextractor.collect_pages import collect_pages
+from wikiextractor.dump_parts import dump_parts
+from wikiextractor.extract.DiscardPruner import DiscardPruner
+from wikiextractor.extract.Template import template_cache
+from wikiextractor.extract.TemplateCalibration import TemplateCalibration
+from wikiextractor.extract.TemplatePolicy import TemplatePolicy, read_titles
 from wikiextractor.extract.extract import Extractor, ignoreTag
 from wikiextractor.load_templates import load_templates
+from wikiextractor.page_filter import parse_filter
 from wikiextractor.parse_arguments import parse_arguments
 from wikiextractor.process_dump import process_dump
+from wikiextractor.template_store import TemplateStore, is_store
+from wikiextractor.utilities import LRUCache, file_codec, require_codec
 def main():
 	args = parse_arguments()
 
@@ -26,8 +35,37 @@ def main():
 	except ValueError:
 		logging.error('Insufficient or invalid size: %s', args.bytes)
 		exit()
+	try:
+		power = 'kmg'.find(args.template_cache[-1].lower()) + 1
+		template_cache_size = int(args.template_cache[:-1] if power else args.template_cache) * 1024 ** power
+	except ValueError:
+		logging.error('Invalid size: %s', args.template_cache)
+		exit()
+	constents.templateCache = template_cache(template_cache_size)
+	Extractor.expansionCache = LRUCache(args.expansion_cache)
+	if args.prune_discarded:
+		Extractor.pruner = DiscardPruner()
+	if args.skip_templates or args.keep_templates:
+		try:
+			Extractor.policy = TemplatePolicy(read_titles(args.skip_templates) if args.skip_templates else (),
+											  read_titles(args.keep_templates) if args.keep_templates else ())
+		except OSError as e:
+			logging.error('Cannot read template list: %s', e)
+			exit()
+	if args.calibrate_templates:
+		if args.calibration_sample < 1:
+			logging.error('Invalid calibration sample: %d', args.calibration_sample)
+			exit()
+		Extractor.calibration = TemplateCalibration(args.calibration_sample)
+
 	if args.namespaces:
 		constents.acceptedNamespaces = set(args.namespaces.split(','))
+	try:
+		constents.pageFilter = parse_filter(args.ns_numbers, args.id_range, args.since,
+											args.until, args.title_regex)
+	except (ValueError, re.error) as e:
+		logging.error('Invalid filter: %s', e)
+		exit()
 
 	FORMAT = '%(levelname)s: %(message)s'
 	logging.basicConfig(format=FORMAT)
@@ -38,7 +76,17 @@ def main():
 	if args.debug:
 		logger.setLevel(logging.DEBUG)
 
-	input_file = args.input
+	try:
+		input_file = dump_parts(args.input)
+		for part in input_file:
+			codec = part != '-' and file_codec(part)
+			if codec:
+				require_codec(codec)
+	except (ValueError, ImportError) as e:
+		logging.error(e)
+		exit()
+	if len(input_file) == 1:
+		input_file = input_file[0]
 
 	if not Extractor.keepLinks:
 		ignoreTag('a')
@@ -50,8 +98,16 @@ def main():
 	if args.article:
 		if args.templates:
 			if os.path.exists(args.templates):
-				with open(args.templates) as file:
-					load_templates(file)
+				if is_store(args.templates):
+					try:
+						TemplateStore(args.templates).install()
+					except ValueError as e:  # from an older version
+						# a single article cannot rebuild it
+						logging.error('%s: rebuild it from the dump with --templates', e)
+						exit()
+				else:
+					with open(args.templates) as file:
+						load_templates(file)
 		with open(input_file) as input:
 			for id, revid, title, page in collect_pages(input):
 				Extractor(id, revid, constents.urlbase, title, page).extract(sys.stdout)
@@ -65,8 +121,31 @@ def main():
 			logging.error('Could not create: %s', output_path)
 			exit()
 
-	process_dump(input_file, args.templates, output_path, file_size,
-					args.compress, args.processes, args.html_safe, not args.no_templates)
+	if args.manifest or args.previous:
+		if output_path == '-':
+			logging.error('Incremental runs need an output directory')
+			exit()
+		if args.previous and os.path.abspath(args.previous) == os.path.abspath(output_path):
+			logging.error('The output directory must differ from the previous one: %s', output_path)
+			exit()
+	if args.reachable_templates and input_file == '-':
+		logging.error('--reachable-templates needs a dump file, which is read twice')
+		exit()
+	if args.changes and not args.previous:
+		logging.error('--changes requires --previous')
+		exit()
+
+	try:
+		process_dump(input_file, args.templates, output_path, file_size,
+						args.compress, args.processes, args.html_safe, not args.no_templates,
+						args.multistream_index, args.decompress_threads, args.spool,
+						args.manifest, args.previous, args.changes, args.prefetch,
+						args.template_profile, args.reachable_templates, args.calibrate_templates,
+						args.constant_templates)
+	except ImportError as e:
+		# a codec of standard input, which cannot be checked in advance
+		logging.error(e)
+		exit()
 
 if __name__ == "__main__":
 	freeze_support()
@@ -0,0 +1,123 @@
+import bz2
+import logging
+import mmap
+import os
+import struct
+
+# ----------------------------------------------------------------------
+# Manifests
+#
+# A run of the extractor can record in its output directory a manifest with a
+# line for each document written:
+#   page id, revid, output file (relative to the output directory), offset, length
+# where offset and length are in bytes of the uncompressed output file.
+# A later run can then take the previous output as reference: pages whose
+# revid did not change are not extracted again, and their documents are copied
+# over byte for byte.
+
+manifestName = 'manifest.tsv'
+
+def manifest_path(out_dir):
+	return os.path.join(out_dir, manifestName)
+
+def read_manifest(out_dir):
+	"""
+	:return: an iterator over the tuples (id, revid, shard, offset, length) of
+	the manifest in :param out_dir:, in output order.
+	"""
+	with open(manifest_path(out_dir), encoding='utf-8') as manifest:
+		for line in manifest:
+			id, revid, shard, offset, length = line.rstrip('\n').split('\t')
+			yield int(id), int(revid or 0), shard, int(offset), int(length)
+
+# sorted lookup table: header (count, offset of the shard names), records
+# sorted by id, shard names separated by newlines.
+lookupHeader = struct.Struct('<QQ')
+lookupRecord = struct.Struct('<QQIQQ')  # id, revid, shard number, offset, length
+
+def build_lookup(previous_dir, lookup_file):
+	"""
+	Sort the manifest of the run in :param previous_dir: by page id into
+	:param lookup_file:, which the processes of this run share through mmap.
+	:return: number of documents in the manifest.
+	"""
+	shards = {}
+	records = []
+	for id, revid, shard, offset, length in read_manifest(previous_dir):
+		n = shards.setdefault(shard, len(shards))
+		records.append(lookupRecord.pack(id, revid, n, offset, length))
+	records.sort(key=lambda r: lookupRecord.unpack_from(r)[0])
+	with open(lookup_file, 'wb') as lookup:
+		lookup.write(lookupHeader.pack(len(records), lookupHeader.size + len(records) * lookupRecord.size))
+		lookup.writelines(records)
+		lookup.write('\n'.join(shards).encode('utf-8'))
+	logging.info("Loaded manifest of %d documents from '%s'", len(records), previous_dir)
+	return len(records)
+
+
+class PreviousRun():
+
+	"""
+	The output of a previous run, with its manifest sorted by build_lookup().
+	"""
+
+	def __init__(self, previous_dir, lookup_file):
+		self.dir = previous_dir
+		self.file = open(lookup_file, 'rb')
+		self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		self.count, shards_offset = lookupHeader.unpack_from(self.buf)
+		self.shards = self.buf[shards_offset:].decode('utf-8').split('\n')
+		self.shard = None  # name of the open output file
+		self.input = None
+
+	def find(self, id):
+		"""
+		:return: the tuple (revid, shard, offset, length) of the document of page
+		:param id:, or None.
+		"""
+		id = int(id)
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if struct.unpack_from('<Q', self.buf, lookupHeader.size + mid * lookupRecord.size)[0] < id:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < self.count:
+			found, revid, shard, offset, length = lookupRecord.unpack_from(
+				self.buf, lookupHeader.size + lo * lookupRecord.size)
+			if found == id:
+				return revid, self.shards[shard], offset, length
+		return None
+
+	def unchanged(self, id, revid):
+		"""Whether the document of page :param id: at :param revid: is in the previous output."""
+		entry = self.find(id)
+		return entry is not None and str(entry[0]) == revid
+
+	def read(self, shard, offset, length):
+		"""
+		:return: the text of a document in the previous output.
+		"""
+		if shard != self.shard:
+			if self.input:
+				self.input.close()
+			path = os.path.join(self.dir, shard)
+			# compressed files are decompressed sequentially on seek
+			self.input = bz2.open(path, 'rb') if shard.endswith('.bz2') else open(path, 'rb')
+			self.shard = shard
+		self.input.seek(offset)
+		return self.input.read(length).decode('utf-8')
+
+	def document(self, id):
+		"""
+		:return: the text of the document of page :param id:.
+		"""
+		_, shard, offset, length = self.find(id)
+		return self.read(shard, offset, length)
+
+	def close(self):
+		if self.input:
+			self.input.close()
+		self.buf.close()
+		self.file.close()
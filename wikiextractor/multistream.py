@@ -0,0 +1,55 @@
+import bz2
+import os
+
+from wikiextractor.page_splitter import split_pages
+from wikiextractor.utilities import decode_open
+
+
+def read_multistream_index(index_file):
+	"""
+	Read the stream offsets from the index of a bz2 multistream dump.
+	Each line of the index has the form offset:page_id:title, with one line
+	for each page in the stream starting at offset.
+	:param index_file: name of the `-index.txt.bz2` file.
+	:return: the sorted list of distinct stream offsets.
+	"""
+	offsets = set()
+	with decode_open(index_file) as index:
+		for line in index:
+			colon = line.find(':')
+			if colon > 0:
+				offsets.add(int(line[:colon]))
+	return sorted(offsets)
+
+def stream_ranges(input_file, offsets):
+	"""
+	:param input_file: name of the bz2 multistream dump.
+	:param offsets: the stream offsets from the index.
+	:return: a list of pairs (start, end) of byte offsets of each stream.
+	The stream with the <siteinfo> header precedes the first offset and is not
+	included, the last range extends to the end of file and includes the
+	closing stream.
+	"""
+	ends = offsets[1:] + [os.path.getsize(input_file)]
+	return list(zip(offsets, ends))
+
+def stream_pages(input_file, start, end):
+	"""
+	Decompress the streams between bytes :param start: and :param end: of the
+	dump and collect their pages.
+	:return: an iterator over tuples (id, revid, title, page).
+	"""
+	with open(input_file, 'rb') as file:
+		file.seek(start)
+		data = file.read(end - start)
+	return split_pages(bz2.decompress(data))
+
+def multistream_jobs(input_file, index_file):
+	"""
+	Generate the jobs for extract_chunk_process, one for each stream.
+	:return: an iterator over tuples (chunk, reader, args), where chunk is the
+	sequence number of the stream.
+	"""
+	ranges = stream_ranges(input_file, read_multistream_index(index_file))
+	for chunk, (start, end) in enumerate(ranges):
+		yield (chunk, stream_pages, (input_file, start, end))
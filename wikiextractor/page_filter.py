@@ -0,0 +1,76 @@
+import re
+
+
+class PageFilter():
+
+	"""
+	Selection of the pages of the dump, which readers check as soon as the
+	page header (or the revision timestamp) has been read, so that the text of
+	rejected pages is skipped rather than collected.
+	"""
+
+	def __init__(self, namespaces=None, ids=None, since=None, until=None, title=None):
+		"""
+		:param namespaces: set of namespace numbers to accept.
+		:param ids: pair (first, last) of the page ids to accept, either may be None.
+		:param since: accept revisions with this timestamp or later.
+		:param until: accept revisions with this timestamp or earlier.
+		Timestamps are in ISO 8601 form, like in the dump, and may be
+		truncated, e.g. 2020-07 or 2020-07-22T10.
+		:param title: regular expression that titles must match.
+		"""
+		self.namespaces = namespaces
+		self.first, self.last = ids or (None, None)
+		self.since = since
+		self.until = until
+		self.title = re.compile(title) if title else None
+
+	def accept(self, title, ns, id):
+		"""
+		:return: whether to collect the page, from its header.
+		:param ns: namespace number, or None if the dump does not have it.
+		"""
+		if self.namespaces is not None and ns is not None and ns not in self.namespaces:
+			return False
+		if self.first is not None or self.last is not None:
+			try:
+				id = int(id)
+			except ValueError:
+				return False
+			if self.first is not None and id < self.first:
+				return False
+			if self.last is not None and id > self.last:
+				return False
+		if self.title and not self.title.search(title):
+			return False
+		return True
+
+	def has_timestamp(self):
+		"""Whether the filter depends on the revision timestamp."""
+		return bool(self.since or self.until)
+
+	def accept_timestamp(self, timestamp):
+		if self.since and timestamp < self.since:
+			return False
+		return not self.after(timestamp)
+
+	def after(self, timestamp):
+		"""Whether :param timestamp: is later than the window."""
+		return bool(self.until) and timestamp[:len(self.until)] > self.until
+
+
+def parse_filter(namespaces=None, ids=None, since=None, until=None, title=None):
+	"""
+	Build a PageFilter from command line options.
+	:param namespaces: comma separated namespace numbers, e.g. '0,14'.
+	:param ids: id range FIRST-LAST, where either may be omitted.
+	:return: the filter, or None if no option is given.
+	"""
+	if not (namespaces or ids or since or until or title):
+		return None
+	if namespaces:
+		namespaces = set(int(n) for n in namespaces.split(','))
+	if ids:
+		first, _, last = ids.partition('-')
+		ids = (int(first) if first else None, int(last) if last else None)
+	return PageFilter(namespaces, ids, since, until, title)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Wikipedia Page Index:
+Builds a sidecar index of the pages in a Wikipedia dump file, which allows
+extracting any page without scanning the dump.
+"""
+
+import argparse
+import bisect
+import gzip
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from wikiextractor.decompress import chunkSize, parallel_bz2_blocks
+from wikiextractor.page_splitter import scan_pages
+from wikiextractor.utilities import file_codec
+
+# ----------------------------------------------------------------------
+# Index format
+#
+# header: magic, kind of dump, number of pages, offset of the titles.
+# records, sorted by page id: id, revid, position, offset, title position,
+#   namespace, title length.
+# titles: the UTF-8 titles, concatenated.
+#
+# The page starts at byte offset within the data obtained by decompressing
+# the dump from position, which is:
+#  - plain: a byte offset in the file;
+#  - bz2: the bit position of a bz2 block in the file, which can be
+#    decompressed independently of the previous ones;
+#  - gz: a byte offset in the decompressed data, hence seeking is linear.
+
+indexMagic = b'WXPAGES1'
+header = struct.Struct('<8sIQQ')
+record = struct.Struct('<QQQQQhH')
+
+kindPlain = 0
+kindBz2 = 1
+kindGz = 2
+
+def dump_kind(input_file):
+	codec = file_codec(input_file)
+	if codec == 'bz2':
+		return kindBz2
+	elif codec == 'gz':
+		return kindGz
+	elif codec:
+		raise ValueError("Cannot index %s dumps: %s" % (codec, input_file))
+	return kindPlain
+
+def dump_chunks(input_file, kind, threads=1):
+	"""
+	:return: an iterator over pairs (position, data) covering the
+	decompressed dump, where position is as described for the index format.
+	"""
+	if kind == kindBz2:
+		yield from parallel_bz2_blocks(input_file, threads)
+		return
+	opener = gzip.open if kind == kindGz else open
+	with opener(input_file, 'rb') as file:
+		position = 0
+		while True:
+			data = file.read(chunkSize * 16)
+			if not data:
+				break
+			yield position, data
+			position += len(data)
+
+def index_pages(chunks):
+	"""
+	Locate the pages in the data produced by :param chunks:.
+	:return: an iterator over tuples (id, revid, position, offset, ns, title).
+	"""
+	buffer = b''
+	starts = []  # offsets in buffer of the chunks
+	positions = []  # their positions
+	for position, data in chunks:
+		starts.append(len(buffer))
+		positions.append(position)
+		buffer += data
+		last = 0  # end of last complete page
+		for begin, end, title, ns, id, revid, _, _, _ in scan_pages(buffer):
+			i = bisect.bisect_right(starts, begin) - 1
+			yield int(id), int(revid or 0), positions[i], begin - starts[i], ns, title
+			last = end
+		# keep the chunks overlapping the incomplete page
+		i = bisect.bisect_right(starts, last) - 1
+		buffer = buffer[last:]
+		starts = [s - last for s in starts[i:]]
+		positions = positions[i:]
+
+def build_index(input_file, index_file, threads=1):
+	"""
+	Build the index of the pages in :param input_file:, in one pass.
+	:param threads: number of threads for decompressing a bz2 dump.
+	:return: number of pages indexed.
+	"""
+	kind = dump_kind(input_file)
+	records = []  # in memory, once ids are found out of order
+	last_id = -1
+	with open(index_file, 'w+b') as index, tempfile.TemporaryFile() as titles:
+		index.write(header.pack(indexMagic, kind, 0, 0))
+		title_pos = 0
+		for id, revid, position, offset, ns, title in index_pages(dump_chunks(input_file, kind, threads)):
+			title = title.encode('utf-8')
+			titles.write(title)
+			rec = record.pack(id, revid, position, offset, title_pos, ns, len(title))
+			title_pos += len(title)
+			if not records and id < last_id:
+				logging.info("Page ids are not in order: sorting the index in memory.")
+				records.append(rec)
+			elif records:
+				records.append(rec)
+			else:
+				index.write(rec)
+				last_id = id
+		count = (index.tell() - header.size) // record.size
+		if records:
+			# reread the records written so far and sort all of them
+			index.seek(header.size)
+			data = index.read(count * record.size)
+			records += [data[i:i + record.size] for i in range(0, len(data), record.size)]
+			records.sort(key=lambda r: record.unpack_from(r)[0])
+			index.seek(header.size)
+			index.truncate()
+			for rec in records:
+				index.write(rec)
+			count = len(records)
+		titles_offset = index.tell()
+		titles.seek(0)
+		while True:
+			data = titles.read(chunkSize)
+			if not data:
+				break
+			index.write(data)
+		index.seek(0)
+		index.write(header.pack(indexMagic, kind, count, titles_offset))
+	logging.info("Indexed %d pages of '%s' in '%s'", count, input_file, index_file)
+	return count
+
+
+class PageIndex():
+
+	"""
+	Index of the pages of a dump, built by build_index().
+	Lookups use binary search on the memory mapped file.
+	"""
+
+	def __init__(self, index_file):
+		self.file = open(index_file, 'rb')
+		self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, self.kind, self.count, self.titles_offset = header.unpack_from(self.buf)
+		if magic != indexMagic:
+			self.close()
+			raise ValueError('Not a page index: %s' % index_file)
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, i):
+		"""
+		:return: the tuple (id, revid, position, offset, ns, title) of the
+		:param i:-th page, in order of id.
+		"""
+		id, revid, position, offset, title_pos, ns, title_len = record.unpack_from(
+			self.buf, header.size + i * record.size)
+		title_pos += self.titles_offset
+		title = self.buf[title_pos:title_pos + title_len].decode('utf-8')
+		return id, revid, position, offset, ns, title
+
+	def find(self, id):
+		"""
+		:return: the entry for page :param id:, or None.
+		"""
+		id = int(id)
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if struct.unpack_from('<Q', self.buf, header.size + mid * record.size)[0] < id:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < self.count:
+			entry = self[lo]
+			if entry[0] == id:
+				return entry
+		return None
+
+	def close(self):
+		self.buf.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+def read_at(input_file, kind, position):
+	"""
+	:return: an iterator over the data of the dump :param input_file:,
+	decompressed from :param position:.
+	"""
+	if kind == kindBz2:
+		blocks = parallel_bz2_blocks(input_file, 1, position)
+		try:
+			for _, data in blocks:
+				yield data
+		finally:
+			blocks.close()
+		return
+	opener = gzip.open if kind == kindGz else open
+	with opener(input_file, 'rb') as file:
+		file.seek(position)
+		while True:
+			data = file.read(chunkSize)
+			if not data:
+				break
+			yield data
+
+def read_page(input_file, index_file, id):
+	"""
+	Read page :param id: from :param input_file:, using its index.
+	:param index_file: the index of :param input_file:, from build_index().
+	:return: the XML of the page, from <page> to </page>, or None if the page
+	is not in the index.
+	"""
+	with PageIndex(index_file) as index:
+		entry = index.find(id)
+		kind = index.kind
+	if not entry:
+		return None
+	_, _, position, offset, _, _ = entry
+	data = bytearray()
+	for chunk in read_at(input_file, kind, position):
+		data += chunk
+		end = data.find(b'</page>', max(offset, len(data) - len(chunk) - 6))
+		if end >= 0:
+			return data[offset:end + 7].decode('utf-8')
+	return None
+
+def main():
+	parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]),
+									 formatter_class=argparse.RawDescriptionHelpFormatter,
+									 description=__doc__)
+	parser.add_argument("input",
+						help="XML wiki dump file (.xml, .bz2 or .gz)")
+	parser.add_argument("index",
+						help="index file to create")
+	parser.add_argument("--threads", type=int, default=1,
+						help="number of threads for decompressing bz2 dumps (default %(default)s)")
+	parser.add_argument("-q", "--quiet", action="store_true",
+						help="suppress reporting progress info")
+	args = parser.parse_args()
+
+	logging.basicConfig(format='%(levelname)s: %(message)s',
+						level=logging.WARNING if args.quiet else logging.INFO)
+	build_index(args.input, args.index, args.threads)
+
+if __name__ == '__main__':
+	main()
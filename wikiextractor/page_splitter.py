@@ -0,0 +1,218 @@
+import mmap
+import os
+
+from wikiextractor import constents
+from wikiextractor.collect_pages import keep_page
+from wikiextractor.extract.extract import Extractor
+
+# ----------------------------------------------------------------------
+# Byte level READER
+#
+# Pages are located with bytes.find() on the raw dump, which avoids decoding
+# and matching tagRE on every line. Only the text of the pages that are kept
+# gets decoded.
+
+def element(buf, tag, start, end):
+	"""
+	:return: the content of the first element <:param tag:> in buf[start:end],
+	as bytes, or None if there is none.
+	"""
+	s = buf.find(b'<' + tag + b'>', start, end)
+	if s < 0:
+		return None
+	s += len(tag) + 2
+	e = buf.find(b'</' + tag + b'>', s, end)
+	return buf[s:e] if e >= 0 else None
+
+def scan_pages(buf, start=0, end=None):
+	"""
+	Find the pages in :param buf: whose <page> tag starts within [start, end).
+	The last page may extend beyond end, hence two consecutive ranges share no
+	page and miss none.
+	:param buf: bytes or mmap of an uncompressed dump.
+	:return: an iterator over tuples
+	(begin, end, title, ns, id, revid, redirect, text_start, text_end),
+	where begin and end delimit the <page> element, and the text of the page is
+	buf[text_start:text_end].
+	"""
+	size = len(buf)
+	if end is None:
+		end = size
+	cur = start
+	while True:
+		# the tag must start before end
+		begin = buf.find(b'<page>', cur, min(end + 5, size))
+		if begin < 0:
+			return
+		text_start = text_end = close = -1
+		revision = buf.find(b'<revision>', begin, size)
+		if revision >= 0 and buf.find(b'</page>', begin, revision) < 0:
+			s = buf.find(b'<text', revision, size)
+			gt = buf.find(b'>', s, size) if s >= 0 else -1
+			if gt >= 0 and buf[gt - 1:gt] == b'/':  # empty <text/>
+				text_start = text_end = gt + 1
+			elif gt >= 0:
+				text_start = gt + 1
+				# the text is at least as long as its unescaped size in bytes=
+				skip = 0
+				n = buf.find(b' bytes="', s, gt)
+				if n >= 0:
+					n += 8
+					skip = int(buf[n:buf.find(b'"', n, gt)] or 0)
+				text_end = buf.find(b'</text>', text_start + skip, size)
+			if text_end >= 0:
+				close = buf.find(b'</page>', text_end, size)
+		if close < 0:
+			# no revision, or malformed: fall back to searching the page end
+			close = buf.find(b'</page>', begin, size)
+			if close < 0:  # truncated
+				return
+			if revision < 0 or revision > close:
+				revision = close
+			text_start = text_end = close
+			s = buf.find(b'<text', revision, close)
+			if s >= 0:
+				gt = buf.find(b'>', s, close)
+				if gt >= 0 and buf[gt - 1:gt] != b'/':  # not empty <text/>
+					text_start = gt + 1
+					text_end = buf.find(b'</text>', text_start, close)
+					if text_end < 0:
+						text_end = text_start
+		cur = close + 7
+		title = element(buf, b'title', begin, revision)
+		title = title.decode('utf-8') if title is not None else ''
+		ns = element(buf, b'ns', begin, revision)
+		ns = int(ns) if ns else 0
+		id = element(buf, b'id', begin, revision)
+		id = id.decode('utf-8') if id is not None else ''
+		revid = element(buf, b'id', revision, text_start)
+		revid = revid.decode('utf-8') if revid is not None else ''
+		redirect = buf.find(b'<redirect', begin, revision) >= 0
+		yield begin, cur, title, ns, id, revid, redirect, text_start, text_end
+
+def revisions(buf, start, end):
+	"""
+	Find the revisions of the page in buf[start:end], as in history dumps.
+	:return: an iterator over tuples (revid, timestamp, text_start, text_end).
+	"""
+	cur = start
+	while True:
+		revision = buf.find(b'<revision>', cur, end)
+		if revision < 0:
+			return
+		s = buf.find(b'<text', revision, end)
+		gt = buf.find(b'>', s, end) if s >= 0 else -1
+		if gt < 0:
+			return
+		revid = element(buf, b'id', revision, s)
+		revid = revid.decode('utf-8') if revid is not None else ''
+		timestamp = element(buf, b'timestamp', revision, s)
+		timestamp = timestamp.decode('utf-8') if timestamp is not None else None
+		if buf[gt - 1:gt] == b'/':  # empty <text/>
+			text_start = text_end = cur = gt + 1
+		else:
+			text_start = gt + 1
+			text_end = buf.find(b'</text>', text_start, end)
+			if text_end < 0:
+				return
+			cur = text_end + 7
+		yield revid, timestamp, text_start, text_end
+
+def choose_revision(buf, start, end):
+	"""
+	:return: the newest revision of the page in buf[start:end] within the
+	timestamp window of constents.pageFilter, as a tuple like those from
+	revisions(), or None.
+	"""
+	pageFilter = constents.pageFilter
+	timeFilter = pageFilter and pageFilter.has_timestamp()
+	chosen = None
+	for revision in revisions(buf, start, end):
+		timestamp = revision[1]
+		if not timeFilter or (timestamp is not None and pageFilter.accept_timestamp(timestamp)):
+			chosen = revision
+		elif chosen and timestamp and pageFilter.after(timestamp):
+			break  # revisions are in chronological order
+	return chosen
+
+def split_pages(buf, start=0, end=None):
+	"""
+	Collect the pages in buf[start:end] to be extracted, like collect_pages().
+	The text of pages rejected by constents.pageFilter is not decoded.
+	:return: an iterator over tuples (id, revid, title, page).
+	"""
+	pageFilter = constents.pageFilter
+	timeFilter = pageFilter and pageFilter.has_timestamp()
+	last_id = ''
+	for begin, close, title, ns, id, revid, redirect, s, e in scan_pages(buf, start, end):
+		if not keep_page(title, id, last_id, redirect):
+			continue
+		if pageFilter and not pageFilter.accept(title, ns, id):
+			continue
+		if timeFilter or buf.find(b'<revision>', e, close) >= 0:
+			chosen = choose_revision(buf, begin, close)
+			if not chosen:
+				continue
+			revid, _, s, e = chosen
+		yield (id, revid, title, [buf[s:e].decode('utf-8')])
+		last_id = id
+
+def mmap_pages(input_file):
+	"""
+	Collect the pages to be extracted from the uncompressed dump :param input_file:.
+	:return: an iterator over tuples (id, revid, title, page).
+	"""
+	if not os.path.getsize(input_file):
+		return
+	with open(input_file, 'rb') as file:
+		with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+			yield from split_pages(buf)
+
+# Size of the byte ranges of an uncompressed dump scanned by each job
+rangeSize = 32 * 1024 * 1024
+
+def range_pages(input_file, start, end):
+	"""
+	Collect the pages to be extracted whose <page> tag starts within bytes
+	[start, end) of the uncompressed dump :param input_file:.
+	:return: an iterator over tuples (id, revid, title, page).
+	"""
+	with open(input_file, 'rb') as file:
+		with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+			yield from split_pages(buf, start, end)
+
+def range_jobs(input_file, count=1):
+	"""
+	Split the uncompressed dump :param input_file: into byte ranges, to be
+	scanned in parallel by extract_chunk_process. Each job resynchronizes on
+	the first <page> within its range, and completes the last page beyond it,
+	so that each page belongs to exactly one range.
+	:param count: minimum number of ranges.
+	:return: an iterator over tuples (chunk, reader, args).
+	"""
+	size = os.path.getsize(input_file)
+	if not size:
+		return
+	count = max(count, (size + rangeSize - 1) // rangeSize)
+	step = (size + count - 1) // count
+	for chunk, start in enumerate(range(0, size, step)):
+		yield (chunk, range_pages, (input_file, start, min(start + step, size)))
+
+def mmap_template_pages(input_file):
+	"""
+	Collect the templates and modules from the uncompressed dump :param input_file:.
+	:return: an iterator over pairs (title, page), suitable for define_templates().
+	"""
+	if not os.path.getsize(input_file):
+		return
+	with open(input_file, 'rb') as file:
+		with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+			for begin, close, title, _, _, _, _, s, e in scan_pages(buf):
+				if (title.startswith(Extractor.templatePrefix) or
+						title.startswith(constents.modulePrefix)):
+					if buf.find(b'<revision>', e, close) >= 0:  # history dump
+						chosen = choose_revision(buf, begin, close)
+						if not chosen:
+							continue
+						_, _, s, e = chosen
+					yield title, [buf[s:e].decode('utf-8')]
@@ -6,8 +6,11 @@ def parse_arguments():
 	parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]),
 									 formatter_class=argparse.RawDescriptionHelpFormatter,
 									 description=__doc__)
-	parser.add_argument("input",
-						help="XML wiki dump file")
+	parser.add_argument("input", nargs='+',
+						help="XML wiki dump file, plain or compressed (gz, bz2, xz, zst, lz4), or - for stdin; "
+						"or the parts of a split dump, as files, a directory or a glob pattern")
+	parser.add_argument("--multistream-index", metavar="INDEX",
+						help="index file (-index.txt.bz2) of a bz2 multistream dump, to decompress its streams in parallel")
 	groupO = parser.add_argument_group('Output')
 	groupO.add_argument("-o", "--output", default="text",
 						help="directory for extracted files (or '-' for dumping to stdout)")
@@ -18,6 +21,12 @@ def parse_arguments():
 						help="compress output files using bzip")
 	groupO.add_argument("--json", action="store_true",
 						help="write output in json format instead of the default <doc> format")
+	groupO.add_argument("--manifest", action="store_true",
+						help="write to the output directory a manifest of the documents, for incremental runs")
+	groupO.add_argument("--previous", metavar="DIR",
+						help="output directory of a previous run with --manifest: documents of pages whose revid did not change are copied from it")
+	groupO.add_argument("--changes", action="store_true",
+						help="the input is an adds-changes dump: copy also the documents of the pages not in it from --previous")
 
 	groupP = parser.add_argument_group('Processing')
 	groupP.add_argument("--html", action="store_true",
@@ -27,11 +36,42 @@ def parse_arguments():
 	groupP.add_argument("-ns", "--namespaces", default="", metavar="ns1,ns2",
 						help="accepted namespaces")
 	groupP.add_argument("--templates",
-						help="use or create file containing templates")
+						help="use or create a template store, rebuilt when stale (or use a file containing templates)")
+	groupP.add_argument("--spool", metavar="FILE",
+						help="while collecting templates from a compressed dump, save the pages to be extracted to this temporary file, to avoid reading the dump twice")
+	groupP.add_argument("--reachable-templates", action="store_true",
+						help="keep only the templates that the pages to be extracted may include, directly or through other templates")
+	groupP.add_argument("--constant-templates", action="store_true",
+						help="when building the template store, expand once the templates whose expansion is the same in every page")
 	groupP.add_argument("--no-templates", action="store_true",
 						help="Do not expand templates")
+	groupP.add_argument("--prune-discarded", action="store_true",
+						help="drop the elements discarded from the output, like <ref> and <gallery>, before expanding templates, skipping the templates they contain")
+	groupP.add_argument("--skip-templates", metavar="FILE",
+						help="do not expand the templates listed in FILE, one title per line, e.g. as saved by --calibrate-templates")
+	groupP.add_argument("--keep-templates", metavar="FILE",
+						help="expand the templates listed in FILE, one title per line, even if listed by --skip-templates")
 	groupP.add_argument("--html-safe", default=True,
 						help="use to produce HTML safe output within <doc>...</doc>")
+	groupP.add_argument("--prefetch", type=int, default=1024, metavar="N",
+						help="collect up to N pages ahead in a reader thread while dispatching them (default %(default)s, 0 to disable)")
+	groupP.add_argument("--expansion-cache", type=int, default=10000, metavar="N",
+						help="remember the expansions of up to N template invocations in each process (default %(default)s, 0 to disable)")
+	groupP.add_argument("--template-cache", default="256M", metavar="n[KMG]",
+						help="memory for the parsed templates in each process, beyond which the least recently used are parsed again (default %(default)s)")
+	groupP.add_argument("--decompress-threads", type=int, default=0, metavar="N",
+						help="decompress input in N threads: bz2 blocks in parallel, other codecs in a background thread (default 0: in the reading thread)")
+	groupF = parser.add_argument_group('Filters', 'select pages while reading the dump, skipping the text of the others')
+	groupF.add_argument("--ns-numbers", metavar="N1,N2",
+						help="accepted namespace numbers, e.g. 0,14")
+	groupF.add_argument("--id-range", metavar="FIRST-LAST",
+						help="accepted page ids, either bound may be omitted")
+	groupF.add_argument("--since", metavar="TIMESTAMP",
+						help="accept revisions from this time on, e.g. 2020-07-22T10:00:00Z or 2020-07")
+	groupF.add_argument("--until", metavar="TIMESTAMP",
+						help="accept revisions up to this time: for history dumps, extract the revision current at this time")
+	groupF.add_argument("--title-regex", metavar="REGEX",
+						help="accept pages whose title matches REGEX")
 	default_process_count = cpu_count() - 1
 	parser.add_argument("--processes", type=int, default=default_process_count,
 						help="Number of processes to use (default %(default)s)")
@@ -41,6 +81,12 @@ def parse_arguments():
 						help="suppress reporting progress info")
 	groupS.add_argument("--debug", action="store_true",
 						help="print debug info")
+	groupS.add_argument("--template-profile", metavar="FILE",
+						help="write to FILE the cost of expanding each template (calls, cumulative and self time, bytes, depth, recursion limit hits), as TSV or as JSON if FILE ends in .json")
+	groupS.add_argument("--calibrate-templates", metavar="FILE",
+						help="on a sample of the pages, find the templates whose expansion contributes no text, and save their titles to FILE, for --skip-templates")
+	groupS.add_argument("--calibration-sample", type=int, default=10, metavar="N",
+						help="calibrate on one page in N, by page id (default %(default)s)")
 	groupS.add_argument("-a", "--article", action="store_true",
 						help="analyze a file containing a single article (debug option)")
 	groupS.add_argument("-v", "--version", action="version",
@@ -0,0 +1,79 @@
+import queue
+import threading
+from timeit import default_timer
+
+# ----------------------------------------------------------------------
+# Prefetching reader
+#
+# Reading, decompressing and collecting pages proceeds in a thread of its own,
+# filling a bounded buffer, while the main thread dispatches jobs and may block
+# on a full jobs queue. Decompression and I/O release the GIL, hence the two
+# overlap.
+
+class Prefetcher():
+
+	"""
+	Iterator over the items of another iterator, consumed ahead in a
+	background thread. Items are passed in batches, to limit the locking.
+	Counters tell whether the producer or the consumer is the bottleneck:
+	 - producer_wait: seconds the producer waited for room in the buffer;
+	 - consumer_wait: seconds the consumer waited for items.
+	"""
+
+	def __init__(self, items, size=1024, batch=64):
+		"""
+		:param items: the iterator to consume.
+		:param size: maximum number of items buffered.
+		"""
+		self.items = items
+		self.batch = batch
+		self.buffer = queue.Queue(maxsize=max(1, size // batch))
+		self.stop = threading.Event()
+		self.produced = 0
+		self.producer_wait = 0.0
+		self.consumer_wait = 0.0
+		self.thread = threading.Thread(target=self.produce, daemon=True)
+		self.thread.start()
+
+	def put(self, batch):
+		start = default_timer()
+		while not self.stop.is_set():
+			try:
+				self.buffer.put(batch, timeout=0.1)
+				break
+			except queue.Full:
+				pass
+		self.producer_wait += default_timer() - start
+
+	def produce(self):
+		try:
+			batch = []
+			for item in self.items:
+				if self.stop.is_set():
+					return
+				batch.append(item)
+				if len(batch) == self.batch:
+					self.put(batch)
+					self.produced += len(batch)
+					batch = []
+			self.put(batch)
+			self.produced += len(batch)
+			self.put(None)
+		except Exception as e:
+			self.put(e)
+
+	def __iter__(self):
+		while True:
+			start = default_timer()
+			batch = self.buffer.get()
+			self.consumer_wait += default_timer() - start
+			if batch is None:
+				return
+			if isinstance(batch, Exception):
+				raise batch
+			yield from batch
+
+	def close(self):
+		"""Stop the producer, e.g. when the consumer did not get to the end."""
+		self.stop.set()
+		self.thread.join()
@@ -1,42 +1,196 @@
 import logging, os , re , sys
+import tempfile
 from multiprocessing import get_context
 from timeit import default_timer
 from wikiextractor import constents
-from wikiextractor.Multiprocess_support import extract_process, reduce_process
+from wikiextractor.Multiprocess_support import collect_stats, config_snapshot, extract_chunk_process, extract_process, reduce_process, report_stats
 from wikiextractor.collect_pages import collect_pages
+from wikiextractor.dump_parts import part_jobs, part_pages, parts_template_pages
 from wikiextractor.extract_info import extract_info
-from wikiextractor.load_templates import load_templates
-from wikiextractor.utilities import decode_open
+from wikiextractor.load_templates import constant_templates, define_templates, load_templates, reachable_templates
+from wikiextractor.manifest import PreviousRun, build_lookup
+from wikiextractor.multistream import multistream_jobs
+from wikiextractor.page_splitter import mmap_template_pages, range_jobs
+from wikiextractor.prefetch import Prefetcher
+from wikiextractor.template_store import TemplateStore, dump_key, is_store, save_store
+from wikiextractor.utilities import decode_open, file_codec
+
+def extraction_pages(input_file, parts, multistream_index, pages_file):
+	"""
+	Read again the pages to be extracted, from the same sources as the workers.
+	:return: an iterator over their texts.
+	"""
+	if parts:
+		jobs = part_jobs(parts)
+	elif multistream_index:
+		jobs = multistream_jobs(input_file, multistream_index)
+	else:
+		jobs = [(0, part_pages, (pages_file or input_file,))]
+	for _, reader, args in jobs:
+		for _, _, _, page in reader(*args):
+			yield ''.join(page)
 
 def process_dump(input_file, template_file, out_file, file_size, file_compress,
-				 process_count, html_safe, expand_templates=True):
+				 process_count, html_safe, expand_templates=True, multistream_index=None,
+				 decompress_threads=0, spool_file=None, manifest=False, previous_dir=None,
+				 changes=False, prefetch=1024, template_profile=None, reachable=False,
+				 calibration_file=None, constants=False):
 	"""
-	:param input_file: name of the wikipedia dump file; '-' to read from stdin
-	:param template_file: optional file with template definitions.
+	:param input_file: name of the wikipedia dump file; '-' to read from stdin;
+	or the list of the names of the parts of a split dump.
+	:param template_file: optional template store, reused if it was built from
+	the same dump, and otherwise (re)built; or a file with template definitions.
 	:param out_file: directory where to store extracted data, or '-' for stdout
 	:param file_size: max size of each extracted file, or None for no max (one file)
 	:param file_compress: whether to compress files with bzip.
 	:param process_count: number of extraction processes to spawn.
 	:html_safe: whether to convert entities in text to HTML.
 	:param expand_templates: whether to expand templates.
+	:param multistream_index: optional index of a bz2 multistream dump: its
+	streams are then decompressed and collected by the workers in parallel.
+	:param decompress_threads: number of threads for decompressing the dump.
+	:param spool_file: temporary file where to save the pages to be extracted
+	while collecting templates from a compressed dump, so that the dump is read
+	and decompressed only once.
+	:param manifest: whether to write a manifest of the documents in out_file.
+	:param previous_dir: optional output directory of a previous run, with its
+	manifest: the documents of pages with the same revid are copied from it
+	rather than extracted.
+	:param changes: whether the input is a dump of the pages added or changed
+	since the previous run, whose other documents are then copied as well.
+	:param prefetch: number of pages that a reader thread collects ahead of
+	dispatching, or 0 to read them in the dispatching thread.
+	:param template_profile: optional file where to write the cost of the
+	expansion of each template.
+	:param reachable: whether to keep only the templates that the pages to be
+	extracted may include. Pages are then read once more, or spooled.
+	:param calibration_file: optional file where to write the templates found
+	to contribute no text, when calibrating.
+	:param constants: whether to expand in advance, when building a store, the
+	templates whose expansion is the same in every page: only those reachable,
+	if :param reachable:.
 	"""
-	input = decode_open(input_file)
+	parts = None
+	if isinstance(input_file, list):
+		# parts of a split dump: the first one provides the <siteinfo>
+		parts = input_file
+		input_file = parts[0]
+		logging.info("Processing %d dump parts.", len(parts))
+	input = decode_open(input_file, threads=decompress_threads)
 	extract_info(input)
+	key = dump_key(parts or input_file)
+	# uncompressed dumps are split at the byte level
+	uncompressed = input_file != '-' and not file_codec(input_file)
+	pages_file = input_file if uncompressed else None
+	# reuse the templates saved by a previous run, unless they are stale
+	store = None
+	saved_templates = expand_templates and template_file and os.path.exists(template_file)
+	if saved_templates and is_store(template_file):
+		if input_file == '-':
+			# nothing tells which dump comes from stdin
+			logging.info("Template store '%s' cannot be checked against standard input: rebuilding it.", template_file)
+		else:
+			try:
+				store = TemplateStore(template_file)
+				if store.key != key:
+					store.close()
+					store = None
+			except ValueError:  # from an older version
+				pass
+			if store:
+				logging.info("Reusing template store '%s', built from the dump with key %s.", template_file, store.key)
+			else:
+				logging.info("Template store '%s' is stale: rebuilding it.", template_file)
+		if not store:
+			saved_templates = False
+	store_file = None  # the store with the templates for the workers
+	temporary_store = False
+	if (input_file == '-' and expand_templates and not spool_file and not saved_templates):
+		# stdin cannot be read twice: spool the pages while collecting templates
+		fd, spool_file = tempfile.mkstemp(suffix='.xml', prefix='wikiextractor')
+		os.close(fd)
+	elif (reachable and expand_templates and not spool_file and not saved_templates and
+		  not (parts or multistream_index or uncompressed)):
+		# the pages are read again, to find the templates they use
+		fd, spool_file = tempfile.mkstemp(suffix='.xml', prefix='wikiextractor')
+		os.close(fd)
 	if expand_templates:
 		# preprocess
 		template_load_start = default_timer()
-		if template_file and os.path.exists(template_file):
-			logging.info("Preprocessing '%s' to collect template definitions: this may take some time.", template_file)
-			file = decode_open(template_file)
-			templates = load_templates(file)
-			file.close()
+		if store:
+			store.install()
+			templates = len(store.templates) + len(store.redirects)
+			store_file = template_file
 		else:
-			logging.info("Preprocessing '%s' to collect template definitions: this may take some time.", input_file)
-			templates = load_templates(input, template_file)
-			input.close()
-			input = decode_open(input_file)
+			if saved_templates:
+				logging.info("Preprocessing '%s' to collect template definitions: this may take some time.", template_file)
+				file = decode_open(template_file)
+				templates = load_templates(file, processes=process_count)
+				file.close()
+			else:
+				logging.info("Preprocessing '%s' to collect template definitions: this may take some time.", input_file)
+				if parts:
+					input.close()
+					templates = define_templates(parts_template_pages(parts, True, decompress_threads), processes=process_count)
+				elif uncompressed:
+					templates = define_templates(mmap_template_pages(input_file), processes=process_count)
+				elif spool_file and not multistream_index:
+					logging.info("Saving pages to '%s'.", spool_file)
+					with open(spool_file, 'w', encoding='utf-8') as spool:
+						templates = load_templates(input, spool=spool, processes=process_count)
+					pages_file = spool_file
+				else:
+					templates = load_templates(input, processes=process_count)
+					input.close()
+					input = decode_open(input_file, threads=decompress_threads)
+			if constants and not reachable:
+				constant = constant_templates()
+				logging.info("Expanded %d constant templates", len(constant))
+			else:
+				constant = {}
+			if template_file and not saved_templates:
+				store_file = template_file
+			else:
+				# the workers map the templates from a store, rather than each
+				# receiving a copy
+				fd, store_file = tempfile.mkstemp(suffix='.store', prefix='wikiextractor')
+				os.close(fd)
+				temporary_store = True
+			save_store(store_file, constents.templates, constents.redirects, constant,
+					   {title: constents.constantIncludes[title] for title in constant}, key)
+			# drop the definitions collected, in favour of the store
+			store = TemplateStore(store_file)
+			store.install()
+		if reachable:
+			reached = reachable_templates(extraction_pages(input_file, parts, multistream_index, pages_file))
+			logging.info("Keeping %d of %d templates, reachable from the pages to be extracted",
+						 len(reached), len(constents.templates))
+			if constants:
+				constant = constant_templates(reached)
+				logging.info("Expanded %d constant templates", len(constant))
+			else:
+				constant = {title: value for title, value in constents.constantTemplates.items() if title in reached}
+			fd, reachable_file = tempfile.mkstemp(suffix='.store', prefix='wikiextractor')
+			os.close(fd)
+			save_store(reachable_file, {title: constents.templates[title] for title in reached},
+					   {title: target for title, target in constents.redirects.items() if target in reached},
+					   constant, {title: constents.constantIncludes[title] for title in constant}, key)
+			store.close()
+			if temporary_store:
+				os.remove(store_file)
+			store_file = reachable_file
+			temporary_store = True
+			store = TemplateStore(store_file)
+			store.install()
 		template_load_elapsed = default_timer() - template_load_start
 		logging.info("Loaded %d templates in %.1fs", templates, template_load_elapsed)
+	previous = None
+	if previous_dir:
+		fd, lookup_file = tempfile.mkstemp(suffix='.lookup', prefix='wikiextractor')
+		os.close(fd)
+		build_lookup(previous_dir, lookup_file)
+		constents.previousRun = (previous_dir, lookup_file)
+		previous = PreviousRun(previous_dir, lookup_file)
 	# process pages
 	logging.info("Starting page extraction from %s.", input_file)
 	extract_start = default_timer()
@@ -48,40 +202,92 @@ def process_dump(input_file, template_file, out_file, file_size, file_compress,
 	# output queue
 	output_queue = ctx.Queue(maxsize=maxsize)
 	# Reduce job that sorts and prints output
-	reduce = Process(target=reduce_process, args=(output_queue, out_file,  file_size, file_compress))
+	articles = ctx.Value('L', 0)
+	reduce = Process(target=reduce_process, args=(output_queue, out_file,  file_size, file_compress, articles,
+													manifest, constents.previousRun, changes))
 	reduce.start()
 	# initialize jobs queue
 	jobs_queue = ctx.Queue(maxsize=maxsize)
 	# start worker processes
 	logging.info("Using %d extract processes.", process_count)
+	if parts or multistream_index or pages_file:
+		# workers decompress and collect their own parts, streams or byte ranges
+		target = extract_chunk_process
+	else:
+		target = extract_process
+	# counters of the workers, reported at the end
+	stats_queue = ctx.Queue()
+	worker_args = (jobs_queue, output_queue, html_safe, config_snapshot(store_file, bool(template_profile)), stats_queue)
 	workers = []
 	for _ in range(max(1, process_count)):
-		extractor = Process(target=extract_process,
-								args=(jobs_queue, output_queue, html_safe))
+		extractor = Process(target=target, args=worker_args)
 		extractor.daemon = True  # only live while parent process lives
 		extractor.start()
 		workers.append(extractor)
-	# we collect individual lines, since str.join() is significantly faster
-	ordinal = 0  # page count
-	for id, revid, title, page in collect_pages(input):
-		job = (id, revid, constents.urlbase, title, page, ordinal)
-		jobs_queue.put(job)  # goes to any available extract_process
-		ordinal += 1
-	input.close()
+	if parts:
+		input.close()
+		for job in part_jobs(parts):
+			jobs_queue.put(job)
+	elif multistream_index:
+		input.close()
+		for job in multistream_jobs(input_file, multistream_index):
+			jobs_queue.put(job)
+	elif pages_file:
+		# uncompressed: the workers scan byte ranges of the file
+		input.close()
+		for job in range_jobs(pages_file, 4 * len(workers)):
+			jobs_queue.put(job)
+	else:
+		# we collect individual lines, since str.join() is significantly faster
+		ordinal = 0  # page count
+		pages = collect_pages(input)
+		if prefetch:
+			pages = Prefetcher(pages, prefetch)
+		dispatch_wait = 0.0  # time blocked on a full jobs queue
+		for id, revid, title, page in pages:
+			if previous and previous.unchanged(id, revid):
+				# the reduce process copies it from the previous output
+				output_queue.put((ordinal, None, id, revid))
+			else:
+				job = (id, revid, constents.urlbase, title, page, ordinal)
+				put_start = default_timer()
+				jobs_queue.put(job)  # goes to any available extract_process
+				dispatch_wait += default_timer() - put_start
+			ordinal += 1
+		input.close()
+		# tell whether reading or extraction is the bottleneck
+		if prefetch:
+			pages.close()
+			logging.info("Reader collected %d pages, waiting %.1fs for dispatch; dispatch waited %.1fs for the reader and %.1fs for the workers",
+						 pages.produced, pages.producer_wait, pages.consumer_wait, dispatch_wait)
+		else:
+			logging.info("Dispatch of %d pages waited %.1fs for the workers", ordinal, dispatch_wait)
 	# signal termination
 	for _ in workers:
 		jobs_queue.put(None)
 	# wait for workers to terminate
-	for w in workers:
-		w.join()
+	stats = collect_stats(workers, stats_queue)
+	if len(stats) < len(workers):
+		logging.warning('%d of %d extract processes failed: their counters, profile and calibration are missing',
+						len(workers) - len(stats), len(workers))
+	report_stats(stats, template_profile, calibration_file)
 	# signal end of work to reduce process
 	output_queue.put(None)
 	# wait for it to finish
 	reduce.join()
+	if spool_file and pages_file == spool_file:
+		os.remove(spool_file)
+	if previous:
+		previous.close()
+		os.remove(lookup_file)
+	if store:
+		store.close()
+		if temporary_store:
+			os.remove(store_file)
 	extract_duration = default_timer() - extract_start
-	extract_rate = ordinal / extract_duration
+	extract_rate = articles.value / extract_duration
 	logging.info("Finished %d-process extraction of %d articles in %.1fs (%.1f art/s)",
-				 process_count, ordinal, extract_duration, extract_rate)
+				 process_count, articles.value, extract_duration, extract_rate)
 
 
 # ----------------------------------------------------------------------
@@ -0,0 +1,195 @@
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+
+from wikiextractor import constents
+from wikiextractor.extract.extract import Extractor
+
+# ----------------------------------------------------------------------
+# Template store
+#
+# Binary file with the template definitions of a dump, already cleaned by
+# define_template(), and its redirects, which loads by just mapping it in
+# memory, instead of parsing and cleaning the templates again.
+#
+# header: magic, version, length of the metadata, then count and offset of
+#   the template table, of the redirect table, of the table of constant
+#   templates, expanded at load time, and of the table of the templates that
+#   these include, one title per line.
+# metadata: JSON with the key of the dump and its siteinfo namespaces.
+# heap: the UTF-8 titles and values. Redirects are flattened, so that they
+#   lead directly to the final page.
+# tables: records (title offset, title length, value offset, value length),
+#   sorted by title, for binary search.
+
+storeMagic = b'WXTPLS01'
+storeVersion = 4
+storeHeader = struct.Struct('<8sIIQQQQQQQQ')
+storeRecord = struct.Struct('<QIQI')
+
+def is_store(filename):
+	"""Whether :param filename: is a template store, rather than a dump of templates."""
+	with open(filename, 'rb') as file:
+		return file.read(len(storeMagic)) == storeMagic
+
+def dump_key(input_file):
+	"""
+	:return: the key identifying the dump :param input_file: for which a store
+	is valid: its dbname, and the name and size of each of its files, which
+	tell apart the parts of a split dump, as well as dumps of the same date,
+	like enwiki-20230101-pages-articles.xml.bz2 and
+	enwiki-20230101-pages-meta-current.xml.bz2.
+	:param input_file: the name of the dump, '-' for stdin, or the list of
+	the names of the parts of a split dump.
+	Standard input is not identified: its stores are never reused.
+	"""
+	key = {'dbname': constents.dbname}
+	if input_file == '-':
+		key['stdin'] = True
+		return key
+	parts = input_file if isinstance(input_file, list) else [input_file]
+	key['files'] = [[os.path.basename(part), os.path.getsize(part)] for part in parts]
+	return key
+
+def siteinfo():
+	"""The settings obtained from <siteinfo>, saved in the store."""
+	return {
+		'templateNamespace': constents.templateNamespace,
+		'moduleNamespace': constents.moduleNamespace,
+		'modulePrefix': constents.modulePrefix,
+		'knownNamespaces': sorted(constents.knownNamespaces),
+	}
+
+def save_store(filename, templates, redirects, constants, includes, key):
+	"""
+	Save the template definitions into a store.
+	:param templates: dict from title to template text.
+	:param redirects: dict from title to title.
+	:param constants: dict from title to the expansion of constant templates.
+	:param includes: dict from title of a constant template to the titles of
+	the templates it includes, one per line.
+	:param key: the dump_key() of the dump.
+	"""
+	meta = json.dumps({'key': key, 'siteinfo': siteinfo()}).encode('utf-8')
+	tmp = filename + '.tmp'
+	with open(tmp, 'wb') as file:
+		file.write(storeHeader.pack(storeMagic, storeVersion, len(meta), 0, 0, 0, 0, 0, 0, 0, 0))
+		file.write(meta)
+		tables = []
+		for table in (templates, redirects, constants, includes):
+			records = []
+			for title, value in table.items():
+				title = title.encode('utf-8')
+				value = value.encode('utf-8')
+				offset = file.tell()
+				file.write(title)
+				file.write(value)
+				records.append((title, storeRecord.pack(offset, len(title), offset + len(title), len(value))))
+			records.sort()
+			tables.append((len(records), file.tell()))
+			file.writelines(record for _, record in records)
+		file.seek(0)
+		file.write(storeHeader.pack(storeMagic, storeVersion, len(meta),
+									*(n for table in tables for n in table)))
+	# replace atomically, since other processes may have it mapped
+	os.replace(tmp, filename)
+	logging.info("Saved %d templates and %d redirects to '%s'", len(templates), len(redirects), filename)
+
+
+class StoreTable(Mapping):
+
+	"""
+	Read-only mapping from titles to values, stored in a table of a store.
+	"""
+
+	def __init__(self, buf, count, offset):
+		self.buf = buf
+		self.count = count
+		self.offset = offset
+
+	def record(self, i):
+		return storeRecord.unpack_from(self.buf, self.offset + i * storeRecord.size)
+
+	def find(self, title):
+		""":return: the record of :param title:, by binary search, or None."""
+		key = title.encode('utf-8')
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			record = self.record(mid)
+			found = self.buf[record[0]:record[0] + record[1]]
+			if found < key:
+				lo = mid + 1
+			elif found > key:
+				hi = mid
+			else:
+				return record
+		return None
+
+	def __getitem__(self, title):
+		record = self.find(title)
+		if record is None:
+			raise KeyError(title)
+		_, _, value_offset, value_len = record
+		return self.buf[value_offset:value_offset + value_len].decode('utf-8')
+
+	def __contains__(self, title):
+		# without decoding the value, unlike Mapping
+		return isinstance(title, str) and self.find(title) is not None
+
+	def __iter__(self):
+		for i in range(self.count):
+			title_offset, title_len, _, _ = self.record(i)
+			yield self.buf[title_offset:title_offset + title_len].decode('utf-8')
+
+	def __len__(self):
+		return self.count
+
+
+class TemplateStore():
+
+	"""
+	A template store mapped in memory: its pages are shared by all the
+	processes that open it.
+	"""
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.file = open(filename, 'rb')
+		self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version = struct.unpack_from('<8sI', self.buf)
+		if magic != storeMagic or version != storeVersion:
+			self.close()
+			raise ValueError('Not a template store of version %d: %s' % (storeVersion, filename))
+		_, _, meta_len, count, offset, redirect_count, redirect_offset, \
+			constant_count, constant_offset, include_count, include_offset = storeHeader.unpack_from(self.buf)
+		meta = json.loads(self.buf[storeHeader.size:storeHeader.size + meta_len].decode('utf-8'))
+		self.key = meta['key']
+		self.siteinfo = meta['siteinfo']
+		self.templates = StoreTable(self.buf, count, offset)
+		self.redirects = StoreTable(self.buf, redirect_count, redirect_offset)
+		self.constants = StoreTable(self.buf, constant_count, constant_offset)
+		self.includes = StoreTable(self.buf, include_count, include_offset)
+
+	def install(self):
+		"""Use the definitions of the store, and its siteinfo namespaces."""
+		constents.templates = self.templates
+		constents.redirects = self.redirects
+		constents.constantTemplates = self.constants
+		constents.constantIncludes = self.includes
+		Extractor.titles.clear()
+		info = self.siteinfo
+		if info['templateNamespace']:
+			constents.templateNamespace = info['templateNamespace']
+			Extractor.templatePrefix = constents.templateNamespace + ':'
+		if info['moduleNamespace']:
+			constents.moduleNamespace = info['moduleNamespace']
+			constents.modulePrefix = info['modulePrefix']
+		constents.knownNamespaces.update(info['knownNamespaces'])
+
+	def close(self):
+		self.buf.close()
+		self.file.close()
@@ -1,25 +1,174 @@
 from html.entities import name2codepoint
 import bz2
+from collections import OrderedDict
+import importlib.util
+import io
 import logging
-import os
 import re
+import sys
 
 from wikiextractor import constents
+from wikiextractor.decompress import open_chunks, parallel_bz2_chunks, stream_chunks
+from wikiextractor.expression import ExprError, evaluate, format_number
 
+# ----------------------------------------------------------------------
+# Input codecs
+#
+# Compressed input is recognized from the magic bytes at its start, not from
+# the file extension. Each codec has an opener, which takes a file name or a
+# binary file object and returns a binary file object with the decompressed
+# data. Codecs relying on optional modules import them only when used.
+
+codecs = {}
+
+def register_codec(name, magic, opener, package=None):
+	"""
+	:param magic: the bytes at the start of data compressed with codec :param name:.
+	:param opener: function from a file name or binary file to a decompressed binary file.
+	:param package: the optional package that :param opener: imports.
+	"""
+	codecs[name] = (magic, opener, package)
 
-def decode_open(filename, mode='rt', encoding='utf-8'):
+def require_codec(name):
+	"""
+	:raise ImportError: naming the package to install, if codec :param name:
+	needs an optional package that is missing.
 	"""
-	Open a file, decode and decompress, depending on extension `gz`, or 'bz2`.
-	:param filename: the file to open.
+	package = codecs[name][2]
+	if package and not importlib.util.find_spec(package):
+		raise ImportError('Reading %s files needs the %s package: pip install %s' % (name, package, package))
+
+def open_gzip(file):
+	import gzip
+	return gzip.GzipFile(file) if isinstance(file, str) else gzip.GzipFile(fileobj=file)
+
+def open_xz(file):
+	import lzma
+	return lzma.LZMAFile(file)
+
+def open_zstd(file):
+	import zstandard  # optional module
+	if isinstance(file, str):
+		file = open(file, 'rb')
+	return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+
+def open_lz4(file):
+	import lz4.frame  # optional module
+	return lz4.frame.open(file, 'rb')
+
+register_codec('gz', b'\x1f\x8b', open_gzip)
+register_codec('bz2', b'BZh', bz2.BZ2File)
+register_codec('xz', b'\xfd7zXZ\x00', open_xz)
+register_codec('zst', b'\x28\xb5\x2f\xfd', open_zstd, 'zstandard')
+register_codec('lz4', b'\x04\x22\x4d\x18', open_lz4, 'lz4')
+
+# Read ahead this many bytes from stdin and from plain files
+readahead = 16 * 1024 * 1024
+
+def detect_codec(magic):
 	"""
-	ext = os.path.splitext(filename)[1]
-	if ext == '.gz':
-		import gzip
-		return gzip.open(filename, mode, encoding=encoding)
-	elif ext == '.bz2':
-		return bz2.open(filename, mode=mode, encoding=encoding)
+	:param magic: the first bytes of a file.
+	:return: the name of the codec of the file, or None if it is not compressed.
+	"""
+	for name, (codec_magic, _, _) in codecs.items():
+		if magic.startswith(codec_magic):
+			return name
+	return None
+
+def file_codec(filename):
+	"""
+	:return: the name of the codec of :param filename:, or None if it is not compressed.
+	"""
+	with open(filename, 'rb') as file:
+		return detect_codec(file.read(8))
+
+def decode_open(filename, mode='rt', encoding='utf-8', threads=0):
+	"""
+	Open a file for reading, decompress and decode it.
+	The compression is recognized from the magic bytes at the start of the file.
+	:param filename: the file to open, or '-' for stdin.
+	:param mode: 'rt' for reading text, 'rb' for reading bytes.
+	:param threads: decompress in other threads: bz2 files are split at block
+	boundaries and decompressed by this number of threads, other codecs by a
+	single background thread.
+	:raise ImportError: if the file needs an optional package that is missing.
+	"""
+	if filename == '-':
+		# pipes deliver data in small pieces, hence a large buffer
+		source = open(sys.stdin.fileno(), 'rb', buffering=readahead, closefd=False)
+		codec = detect_codec(source.peek(8))
+	else:
+		source = filename
+		codec = file_codec(filename)
+	if not codec:
+		if filename != '-':
+			source = open(filename, 'rb', buffering=readahead)
+		if 't' in mode:
+			return io.TextIOWrapper(source, encoding=encoding)
+		return source
+	require_codec(codec)
+	if threads and codec == 'bz2' and filename != '-':
+		chunks = parallel_bz2_chunks(filename, threads)
 	else:
-		return open(filename, mode, encoding=encoding)
+		chunks = stream_chunks(codecs[codec][1](source), threads > 0)
+	return open_chunks(chunks, mode, encoding)
+
+class LRUCache():
+
+	"""
+	Mapping holding only the most recently used entries, which counts hits,
+	misses and evictions.
+	"""
+
+	def __init__(self, maxsize, sizeof=None):
+		"""
+		:param maxsize: maximum number of entries, or of their total size if
+		:param sizeof: is given, 0 to disable the cache.
+		:param sizeof: function returning the approximate size of a value.
+		"""
+		self.maxsize = maxsize
+		self.sizeof = sizeof
+		self.size = 0  # number or total size of the entries
+		self.sizes = {}  # size of each entry, if sizeof is given
+		self.data = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key, default=None):
+		value = self.data.get(key, default)
+		if value is default:
+			self.misses += 1
+		else:
+			self.hits += 1
+			self.data.move_to_end(key)
+		return value
+
+	def __setitem__(self, key, value):
+		size = self.sizeof(value) if self.sizeof else 1
+		if size > self.maxsize:
+			return
+		if key in self.data:
+			self.size -= self.sizes.pop(key, 1)
+		self.data[key] = value
+		self.data.move_to_end(key)
+		if self.sizeof:
+			self.sizes[key] = size
+		self.size += size
+		while self.size > self.maxsize:
+			key, _ = self.data.popitem(last=False)
+			self.size -= self.sizes.pop(key, 1)
+			self.evictions += 1
+
+	def __contains__(self, key):
+		return key in self.data
+
+	def __len__(self):
+		return len(self.data)
+
+	def stats(self):
+		return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
 
 def get_url(urlbase, uid):
 	return "%s?curid=%s" % (urlbase, uid)
@@ -28,6 +177,18 @@ def dropNested(text, openDelim, closeDelim):
 	"""
 	A matching function for nested expressions, e.g. namespaces and tables.
 	"""
+	spans = findNested(text, openDelim, closeDelim)
+	if not spans:
+		return text
+	# collect text outside partitions
+	return dropSpans(spans, text)
+
+
+def findNested(text, openDelim, closeDelim):
+	"""
+	:return: the spans of the outermost blocks of nested expressions between
+	:param openDelim: and :param closeDelim:, as removed by dropNested().
+	"""
 	openRE = re.compile(openDelim, re.IGNORECASE)
 	closeRE = re.compile(closeDelim, re.IGNORECASE)
 	# partition text in separate blocks { } { }
@@ -35,7 +196,7 @@ def dropNested(text, openDelim, closeDelim):
 	nest = 0  # nesting level
 	start = openRE.search(text, 0)
 	if not start:
-		return text
+		return spans
 	end = closeRE.search(text, start.end())
 	next = start
 	while end:
@@ -73,8 +234,7 @@ def dropNested(text, openDelim, closeDelim):
 		if next != start:
 			# { { }
 			nest += 1
-	# collect text outside partitions
-	return dropSpans(spans, text)
+	return spans
 
 
 def dropSpans(spans, text):
@@ -317,15 +477,42 @@ def splitParts(paramsList):
 
 
 
-def sharp_expr(expr):
-	try:
-		expr = re.sub('=', '==', expr)
-		expr = re.sub('mod', '%', expr)
-		expr = re.sub('\bdiv\b', '/', expr)
-		expr = re.sub('\bround\b', '|ROUND|', expr)
-		return str(eval(expr))
-	except:
+# Values of the expressions of #expr and #ifexpr, as text, or None if invalid.
+# Expressions have no variables, hence the same text has the same value.
+exprCache = LRUCache(10000)
+unevaluated = object()
+
+def expression(expr):
+	""":return: the value of :param expr: as text, '' if empty, or None if invalid."""
+	expr = expr.strip()
+	value = exprCache.get(expr, unevaluated)
+	if value is unevaluated:
+		try:
+			value = evaluate(expr)
+			value = '' if value is None else format_number(value)
+		except ExprError as e:
+			logging.debug('Expression error in %s: %s', expr, e)
+			value = None
+		exprCache[expr] = value
+	return value
+
+
+def sharp_expr(expr, *args):
+	value = expression(expr)
+	if value is None:
+		return '<span class="error"></span>'
+	return value
+
+
+def sharp_ifexpr(expr, valueIfTrue='', valueIfFalse='', *args):
+	# The {{#ifexpr:}} function is an if-then-else construct, testing
+	# whether the value of the expression is not zero.
+	value = expression(expr)
+	if value is None:
 		return '<span class="error"></span>'
+	if value and float(value):
+		return valueIfTrue.strip()
+	return valueIfFalse.strip()
 
 
 def sharp_if(testValue, valueIfTrue, valueIfFalse=None, *args):